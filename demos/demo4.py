@@ -1,4 +1,4 @@
-from dsl import Session
+from knowledgeflow import Session
 
 bits = 8
 
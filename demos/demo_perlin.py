@@ -1,4 +1,4 @@
-from dsl import Session
+from knowledgeflow import Session
 
 sess = Session()
 
@@ -8,17 +8,25 @@ NUM_BITS = 254
 
 sess.include("circomlib/circuits/mimcsponge.circom")
 mimc_sponge = sess.extern(
-    "MiMCSponge", args=[3, 4, 1], inputs={"ins": [3], "k": 1}, output=["outs"]
+    "MiMCSponge",
+    args=[3, 4, 1],
+    inputs={"ins": [3], "k": 1},
+    output=["outs"],
+    pure=True,
 )
 
 sess.include("circomlib/circuits/bitify.circom")
-num2bits = sess.extern("Num2Bits", args=[NUM_BITS], inputs={"in": 1}, output=["out"])
+num2bits = sess.extern(
+    "Num2Bits", args=[NUM_BITS], inputs={"in": 1}, output=["out"], pure=True
+)
 
 sess.include("circomlib/circuits/sign.circom")
-sign = sess.extern("Sign", inputs={"in": [NUM_BITS]}, output="sign")
+sign = sess.extern("Sign", inputs={"in": [NUM_BITS]}, output="sign", pure=True)
 
 sess.include("circomlib/circuits/comparators.circom")
-lessthan = sess.extern("LessThan", args=[SCALE_BITS], inputs={"in": [2]}, output="out")
+lessthan = sess.extern(
+    "LessThan", args=[SCALE_BITS], inputs={"in": [2]}, output="out", pure=True
+)
 
 sess.include("range_proof/circuit.circom")
 multirangeproof = sess.extern(
@@ -27,11 +35,6 @@ multirangeproof = sess.extern(
     inputs={"in": [3]},
 )
 
-sess.include("QuinSelector.circom")
-quinselector = sess.extern(
-    "QuinSelector", args=[16], inputs={"in": [16], "index": 1}, output="out",
-)
-
 
 def random(x, y, scale):
     full_random = mimc_sponge(ins=[x, y, scale], k=0)
@@ -93,8 +96,9 @@ def random_gradient_at(x, y, scale):
     denom = BIGNUM // 1000
 
     index = random(x, y, scale)
-    grad_x = quinselector(_in=[x for x, y in vecs], index=index)
-    grad_y = quinselector(_in=[y for x, y in vecs], index=index)
+    grad_x, grad_y = sess.select_many(
+        [[x for x, y in vecs], [y for x, y in vecs]], index
+    )
     return (grad_x * denom, grad_y * denom)
 
 
@@ -131,13 +135,6 @@ def dot(a, b):
     return div(sum, BIGNUM)
 
 
-def summation(xs):
-    out = xs[0]
-    for x in xs[1:]:
-        out = out + x
-    return out
-
-
 # coords, grads, and p are fractions
 def perlin_value(coords, grads, p, scale):
     is_bottoms = [True, True, False, False]
@@ -153,7 +150,7 @@ def perlin_value(coords, grads, p, scale):
         weight = get_weight(coord, p, is_bottom, is_left)
         outputs.append(div(dot_prod * weight, BIGNUM))
 
-    return summation(outputs)
+    return sess.sum(outputs)
 
 
 def single_scale_perlin(p, scale):
@@ -0,0 +1,59 @@
+"""A cache of build artifacts on disk, so that circuits that haven't changed
+aren't compiled or set up again."""
+
+import os
+import shutil
+import tempfile
+
+
+class BuildCache:
+    """A directory holding the artifacts built from each circuit, such as its
+    generated code, R1CS, proving key or witness generator, in a subdirectory
+    named after the circuit's `Session.fingerprint`."""
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, fingerprint, name):
+        """Returns the path of the artifact `name` of the circuit, or None if it
+        hasn't been built."""
+        path = os.path.join(self.path, fingerprint, name)
+        if os.path.exists(path):
+            return path
+        return None
+
+    def build(self, fingerprint, name, build):
+        """Returns the path of the artifact `name` of the circuit, building it
+        first if it isn't in the cache. `build` is called with the path to write
+        the artifact to, and can write other files next to it (like the `.sym`
+        file written by `Session.to_r1cs`), which are cached along with it. A
+        failed build leaves nothing behind."""
+        path = self.get(fingerprint, name)
+        if path is not None:
+            return path
+        directory = os.path.join(self.path, fingerprint)
+        os.makedirs(directory, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".build-", dir=directory)
+        try:
+            build(os.path.join(staging, name))
+            if not os.path.exists(os.path.join(staging, name)):
+                raise Exception("building {} didn't write it".format(name))
+            # move the main artifact last, so that it's only found once complete
+            for filename in sorted(os.listdir(staging), key=lambda f: f == name):
+                os.replace(
+                    os.path.join(staging, filename), os.path.join(directory, filename)
+                )
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return os.path.join(directory, name)
+
+    def gen(self, sess, output, name="circuit.circom"):
+        """Returns the path of the code generated for the circuit computing
+        `output`, generating it with `sess.gen_to` on a cache miss. The code
+        contains the names of the circuit's signals, so it's cached under
+        `sess.fingerprint(output, names=True)`."""
+
+        def build(path):
+            with open(path, "w") as fp:
+                sess.gen_to(output, fp)
+
+        return self.build(sess.fingerprint(output, names=True), name, build)
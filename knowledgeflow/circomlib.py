@@ -0,0 +1,363 @@
+"""Python models of the circomlib templates used with `Session.extern`.
+
+Each template has an evaluator, called as `evaluate(args, inputs)` with the
+template's static arguments and a dictionary of its input values, which returns
+a dictionary of its output values, and a `cost(args)` function estimating the
+number of constraints one instance adds to the circuit.
+
+Templates also have a constraint builder, called as `build(cs, args, inputs,
+prefix)` with a `ConstraintSystem` and a dictionary of the linear combinations
+of its inputs, which adds the template's wires and constraints to `cs` and
+returns a dictionary of the linear combinations of its outputs. Wires are
+labelled starting with `prefix`.
+
+Templates without outputs can also have a `merge(calls)` function, which takes
+a list of the static arguments and input dictionaries of several instances and
+returns those of a single instance doing the same checks, or None if there is
+none.
+"""
+
+from .field import P, inverse
+from .r1cs import lc_add, lc_scale
+
+
+class Builtin:
+    def __init__(self, evaluate, cost, build, merge=None):
+        self.evaluate = evaluate
+        self.cost = cost
+        self.build = build
+        self.merge = merge
+
+
+def num2bits(args, inputs):
+    [n] = args
+    value = inputs["in"]
+    return {"out": [(value >> i) & 1 for i in range(n)]}
+
+
+def num2bits_cost(args):
+    [n] = args
+    return n + 1
+
+
+def build_num2bits(cs, args, inputs, prefix):
+    [n] = args
+    return {"out": _build_bits(cs, inputs["in"], n, prefix + ".out")}
+
+
+def _build_bits(cs, lc, n, label):
+    value = cs.value(lc)
+    bits = []
+    total = {}
+    for i in range(n):
+        bit_value = None if value is None else (value >> i) & 1
+        bit = cs.wire("{}[{}]".format(label, i), bit_value)
+        cs.constrain({bit: 1}, {bit: 1, 0: P - 1}, {})
+        total[bit] = 1 << i
+        bits.append({bit: 1})
+    cs.constrain_equal(total, lc)
+    return bits
+
+
+def less_than(args, inputs):
+    [n] = args
+    a, b = inputs["in"]
+    diff = (a + (1 << n) - b) % P
+    return {"out": 1 - ((diff >> n) & 1)}
+
+
+def less_than_cost(args):
+    [n] = args
+    return num2bits_cost([n + 1]) + 1
+
+
+def build_less_than(cs, args, inputs, prefix):
+    [n] = args
+    a, b = inputs["in"]
+    diff = lc_add(lc_add(a, {0: 1 << n}), b, -1)
+    bits = _build_bits(cs, diff, n + 1, prefix + ".n2b.out")
+    return {"out": lc_add({0: 1}, bits[n], -1)}
+
+
+# Sign() compares its input against (P - 1) / 2 with CompConstant
+SIGN_THRESHOLD = (P - 1) // 2
+
+
+def sign(args, inputs):
+    value = sum(bit << i for i, bit in enumerate(inputs["in"]))
+    return {"sign": int(value > SIGN_THRESHOLD)}
+
+
+def sign_cost(args):
+    # 127 parts of CompConstant, then Num2Bits(135) of their sum
+    return 127 + 1 + num2bits_cost([135]) + 1
+
+
+def build_sign(cs, args, inputs, prefix):
+    # CompConstant(SIGN_THRESHOLD) from circomlib's compconstant.circom
+    bits = inputs["in"]
+    b = (1 << 128) - 1
+    a = 1
+    e = 1
+    total = {}
+    for i in range(127):
+        clsb = (SIGN_THRESHOLD >> (i * 2)) & 1
+        cmsb = (SIGN_THRESHOLD >> (i * 2 + 1)) & 1
+        slsb = bits[i * 2]
+        smsb = bits[i * 2 + 1]
+        # part = quadratic * smsb * slsb + linear
+        if cmsb == 0 and clsb == 0:
+            quadratic = -b
+            linear = lc_add(lc_scale(smsb, b), slsb, b)
+        elif cmsb == 0 and clsb == 1:
+            quadratic = a
+            linear = lc_add(lc_add(lc_scale(slsb, -a), smsb, b - a), {0: a})
+        elif cmsb == 1 and clsb == 0:
+            quadratic = b
+            linear = lc_add(lc_scale(smsb, -a), {0: a})
+        else:
+            quadratic = -a
+            linear = {0: a}
+        value = None
+        if cs.values is not None:
+            value = (quadratic * cs.value(smsb) * cs.value(slsb) + cs.value(linear)) % P
+        part = cs.wire("{}.comp.parts[{}]".format(prefix, i), value)
+        cs.constrain(lc_scale(smsb, quadratic), slsb, lc_add({part: 1}, linear, -1))
+        total[part] = 1
+        b -= e
+        a += e
+        e *= 2
+    out = _build_bits(cs, total, 135, prefix + ".comp.num2bits.out")
+    return {"sign": out[127]}
+
+
+def quin_selector(args, inputs):
+    [choices] = args
+    index = inputs["index"]
+    if index < choices:
+        return {"out": inputs["in"][index]}
+    return {"out": 0}
+
+
+def quin_selector_cost(args):
+    [choices] = args
+    # an IsEqual and a multiplication per choice, and a LessThan(4) on the index
+    return 3 * choices + less_than_cost([4]) + 1
+
+
+def build_quin_selector(cs, args, inputs, prefix):
+    [choices] = args
+    index = inputs["index"]
+    less_than = build_less_than(cs, [4], {"in": [index, {0: choices}]}, prefix)
+    cs.constrain_equal(less_than["out"], {0: 1})
+    total = {}
+    for i in range(choices):
+        diff = lc_add({0: i}, index, -1)
+        eq = _build_is_zero(cs, diff, "{}.eqs[{}]".format(prefix, i))
+        label = "{}.calcTotal.in[{}]".format(prefix, i)
+        total = lc_add(total, cs.mul(eq, inputs["in"][i], label))
+    return {"out": total}
+
+
+def _build_is_zero(cs, lc, label):
+    value = cs.value(lc)
+    inv_value = out_value = None
+    if value is not None:
+        inv_value = inverse(value) if value else 0
+        out_value = int(value == 0)
+    inv = cs.wire(label + ".inv", inv_value)
+    out = cs.wire(label + ".out", out_value)
+    cs.constrain(lc, {inv: 1}, {0: 1, out: P - 1})
+    cs.constrain(lc, {out: 1}, {})
+    return {out: 1}
+
+
+def multi_range_proof(args, inputs):
+    return {}
+
+
+def multi_range_proof_cost(args):
+    n, bits, max_abs_value = args
+    # a lower and an upper bound check per input
+    return n * 2 * (less_than_cost([bits]) + 1)
+
+
+def build_multi_range_proof(cs, args, inputs, prefix):
+    n, bits, max_abs_value = args
+    for i, value in enumerate(inputs["in"]):
+        shifted = lc_add({0: max_abs_value}, value)
+        label = "{}.rangeProofs[{}]".format(prefix, i)
+        lower = build_less_than(cs, [bits], {"in": [shifted, {}]}, label + ".lower")
+        cs.constrain_equal(lower["out"], {})
+        upper_in = [{0: 2 * max_abs_value}, shifted]
+        upper = build_less_than(cs, [bits], {"in": upper_in}, label + ".upper")
+        cs.constrain_equal(upper["out"], {})
+    return {}
+
+
+def merge_multi_range_proofs(calls):
+    _, bits, max_abs_value = calls[0][0]
+    if any(list(args[1:]) != [bits, max_abs_value] for args, _ in calls):
+        return None
+    # checking the same signal twice is redundant
+    values = {}
+    for _, inputs in calls:
+        for value in inputs["in"]:
+            values.setdefault(id(value), value)
+    values = list(values.values())
+    return [len(values), bits, max_abs_value], {"in": values}
+
+
+def keccak256(data):
+    """The Keccak-256 hash used by Ethereum (and circomlib to derive constants),
+    which pads differently from SHA3-256."""
+    rate = 136
+    data = bytearray(data)
+    data.append(0x01)
+    data.extend(b"\x00" * (-len(data) % rate))
+    data[-1] |= 0x80
+    state = [0] * 25
+    for offset in range(0, len(data), rate):
+        for i in range(rate // 8):
+            start = offset + 8 * i
+            state[i] ^= int.from_bytes(data[start : start + 8], "little")
+        _keccak_f(state)
+    return b"".join(lane.to_bytes(8, "little") for lane in state[:4])
+
+
+_MASK = (1 << 64) - 1
+_ROTATIONS = [
+    [0, 36, 3, 41, 18],
+    [1, 44, 10, 45, 2],
+    [62, 6, 43, 15, 61],
+    [28, 55, 25, 21, 56],
+    [27, 20, 39, 8, 14],
+]
+
+
+def _round_constants():
+    constants = []
+    r = 1
+    for _ in range(24):
+        constant = 0
+        for j in range(7):
+            if r & 1:
+                constant |= 1 << ((1 << j) - 1)
+            r = ((r << 1) ^ 0x71) if r & 0x80 else (r << 1)
+        constants.append(constant)
+    return constants
+
+
+_ROUND_CONSTANTS = _round_constants()
+
+
+def _rotate(lane, n):
+    return ((lane << n) | (lane >> (64 - n))) & _MASK if n else lane
+
+
+def _keccak_f(state):
+    for constant in _ROUND_CONSTANTS:
+        c = [state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20]
+             for x in range(5)]
+        d = [c[(x - 1) % 5] ^ _rotate(c[(x + 1) % 5], 1) for x in range(5)]
+        b = [0] * 25
+        for x in range(5):
+            for y in range(5):
+                lane = state[x + 5 * y] ^ d[x]
+                b[y + 5 * ((2 * x + 3 * y) % 5)] = _rotate(lane, _ROTATIONS[x][y])
+        for y in range(0, 25, 5):
+            for x in range(5):
+                state[y + x] = b[y + x] ^ (~b[y + (x + 1) % 5] & b[y + (x + 2) % 5])
+        state[0] ^= constant
+
+
+def mimc_constants(rounds=220, seed=b"mimcsponge"):
+    """The round constants of circomlib's MiMC Feistel network. The first and
+    last rounds use a constant of zero."""
+    constants = [0] * rounds
+    digest = keccak256(seed)
+    for i in range(1, rounds - 1):
+        digest = keccak256(digest)
+        constants[i] = int.from_bytes(digest, "big") % P
+    return constants
+
+
+MIMC_CONSTANTS = mimc_constants()
+
+
+def mimc_feistel(rounds, left, right, k):
+    for i in range(rounds):
+        c = 0 if i == rounds - 1 else MIMC_CONSTANTS[i]
+        t = (left + k + c) % P
+        t5 = pow(t, 5, P)
+        if i < rounds - 1:
+            left, right = (right + t5) % P, left
+        else:
+            right = (right + t5) % P
+    return left, right
+
+
+def mimc_sponge(args, inputs):
+    n_inputs, rounds, n_outputs = args
+    k = inputs["k"]
+    left, right = 0, 0
+    for value in inputs["ins"]:
+        left, right = mimc_feistel(rounds, (left + value) % P, right, k)
+    outs = [left]
+    for _ in range(n_outputs - 1):
+        left, right = mimc_feistel(rounds, left, right, k)
+        outs.append(left)
+    return {"outs": outs}
+
+
+def mimc_sponge_cost(args):
+    n_inputs, rounds, n_outputs = args
+    # t^2, t^4 and t^5 in every round of every Feistel instance
+    return 3 * rounds * (n_inputs + n_outputs - 1) + n_outputs
+
+
+def _build_mimc_feistel(cs, rounds, left, right, k, label):
+    for i in range(rounds):
+        c = 0 if i == rounds - 1 else MIMC_CONSTANTS[i]
+        t = lc_add(lc_add(left, k), {0: c})
+        t2 = cs.mul(t, t, "{}.t2[{}]".format(label, i))
+        t4 = cs.mul(t2, t2, "{}.t4[{}]".format(label, i))
+        if i < rounds - 1:
+            t5 = cs.mul(t4, t, "{}.xL[{}]".format(label, i))
+            left, right = lc_add(right, t5), left
+        else:
+            t5 = cs.mul(t4, t, label + ".xR_out")
+            right = lc_add(right, t5)
+    return left, right
+
+
+def build_mimc_sponge(cs, args, inputs, prefix):
+    n_inputs, rounds, n_outputs = args
+    k = inputs["k"]
+    left, right = {}, {}
+    for i, value in enumerate(inputs["ins"]):
+        label = "{}.S[{}]".format(prefix, i)
+        left, right = _build_mimc_feistel(
+            cs, rounds, lc_add(left, value), right, k, label
+        )
+    outs = [left]
+    for i in range(n_outputs - 1):
+        label = "{}.S[{}]".format(prefix, n_inputs + i)
+        left, right = _build_mimc_feistel(cs, rounds, left, right, k, label)
+        outs.append(left)
+    return {"outs": outs}
+
+
+BUILTINS = {
+    "Num2Bits": Builtin(num2bits, num2bits_cost, build_num2bits),
+    "LessThan": Builtin(less_than, less_than_cost, build_less_than),
+    "Sign": Builtin(sign, sign_cost, build_sign),
+    "QuinSelector": Builtin(quin_selector, quin_selector_cost, build_quin_selector),
+    "MultiRangeProof": Builtin(
+        multi_range_proof,
+        multi_range_proof_cost,
+        build_multi_range_proof,
+        merge_multi_range_proofs,
+    ),
+    "MiMCSponge": Builtin(mimc_sponge, mimc_sponge_cost, build_mimc_sponge),
+}
@@ -1,66 +1,1410 @@
+import collections
+import contextlib
+import functools
+import hashlib
+import inspect
+import itertools
+import operator
+import os
 import textwrap
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from . import circomlib
+from .field import P, batch_inverse, inverse
+from .r1cs import (
+    ConstraintSystem,
+    lc_add,
+    lc_constant,
+    write_r1cs,
+    write_sym,
+    write_wtns,
+)
 
 
 class Session:
     """The `Session` class is your starting point for interacting with KnowledgeFlow."""
-    def __init__(self):
+    def __init__(
+        self,
+        debug_names=False,
+        max_name_length=32,
+        cse=True,
+        fold_linear=True,
+        track_origins=False,
+        incremental=False,
+        fuse_externs=False,
+    ):
+        self.debug_names = debug_names
+        self.max_name_length = max_name_length
+        self.cse = cse
+        self.nodes = {}
+        self.fold_linear = fold_linear
+        self.track_origins = track_origins
+        self.incremental = incremental
+        self.fuse_externs = fuse_externs
+        self._linear = {}
+        self._quadratic = {}
+        self._plans = {}
+        self._combinations = {}
+        self._fragments = {}
+        self._cached_fold_linear = fold_linear
+        self._fused_layout = []
+        self.evaluators = {}
         self.names = set()
+        self.name_suffixes = {}
         self.component_names = set()
+        self.component_suffixes = {}
         self.constraints = []
+        self.constraint_origins = []
         self.children = []
         self.includes = set()
-
-    def input(self, name, private=False):
+        self.tracing = None
+        self.template_names = set()
+        self.template_params = []
+
+    def input(self, name, private=False, bounds=None):
+        """Declares an input signal. `bounds`, a pair `(low, high)`, declares that
+        its value is an integer between `low` and `high` inclusive, which the
+        circuit checks, so that gadgets working on it can use fewer bits."""
+        if name in self.names:
+            raise Exception("input named {} not unique in the session".format(name))
+        if bounds is not None:
+            low, high = bounds
+            if low > high or _interval(low, high) is None:
+                raise Exception("invalid bounds {} for input {}".format(bounds, name))
+        node = Input(self, name, private)
+        if bounds is not None:
+            # before the checks, so that the nodes they add inherit the bounds
+            node._bounds = (low, high)
+            width = (high - low).bit_length()
+            self.bits(node - low if low else node, width)
+            if high - low + 1 != 1 << width:
+                self.bits(self.constant(high) - node, width)
+        return node
+
+    def input_array(self, name, length, private=False):
+        """Declares an input array of `length` signals. Arrays support
+        element-wise `+`, `-` and `*` with arrays of the same length or with
+        single signals, indexing and slicing, and can be passed to extern array
+        inputs. Their operations are generated as Circom loops."""
         if name in self.names:
             raise Exception("input named {} not unique in the session".format(name))
-        return Input(self, name, private)
+        assert length > 0
+        return InputArray(self, name, length, private)
+
+    def param(self, name, default, public=False):
+        """Declares a constant of the circuit whose value can change without
+        changing the generated code. By default it becomes a parameter of the
+        `Main` template, whose value, `default` unless `gen` is given another, is
+        set by `component main` when the circuit is compiled. With `public=True`
+        it becomes a public input instead, so that a single compiled circuit and
+        trusted setup serve every value. Witnesses are computed with `default`
+        unless the inputs give another value."""
+        if name in self.names:
+            raise Exception("param named {} not unique in the session".format(name))
+        assert isinstance(default, int)
+        if public:
+            return ParamInput(self, name, default)
+        param = TemplateParam(self, name, default)
+        self.template_params.append(param)
+        return param
+
+    def make(self, cls, *args):
+        """Constructs `cls(*args)`. With common subexpression elimination enabled
+        (`cse=True`, the default), an identical node that was already built in this
+        session is returned instead of a new one."""
+        if not self.cse:
+            return cls(*args)
+        key = (cls,) + tuple(id(arg) if isinstance(arg, Op) else arg for arg in args)
+        return self.intern(key, lambda: cls(*args))
+
+    def intern(self, key, build):
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = build()
+        return node
 
     def add_child(self, child):
         self.children.append(child)
 
     def constant(self, val):
-        return Constant(self, val)
+        return self.make(Constant, self, val)
+
+    def sum(self, xs):
+        """Adds up the signals (or numbers) in `xs` with a single linear
+        expression, rather than a chain of additions."""
+        terms = self._operands(xs)
+        if len(terms) == 1:
+            return terms[0]
+        if any(isinstance(term, Var) for term in terms):
+            return _balanced(terms, operator.add)
+        return self.make(Sum, self, *terms)
+
+    def dot(self, a, b):
+        """Returns the sum of the products of the elements of `a` and `b`, which
+        are lists or arrays of the same length. Each product of two signals adds
+        one constraint, and products with numbers are folded into the sum."""
+        if len(a) != len(b):
+            raise Exception(
+                "can't take the dot product of {} and {} elements".format(
+                    len(a), len(b)
+                )
+            )
+        if isinstance(a, SignalArray) and isinstance(b, SignalArray):
+            return self.sum(a * b)
+        return self.sum(
+            y * x if isinstance(x, int) else x * y for x, y in zip(a, b)
+        )
 
-    def gen(self, output):
-        if output.passthrough:
-            output = IdentityOp(output)
-        includes = ['include "{}"'.format(path) for path in self.includes]
-        traversed = set()
-        signals, statements = output._gen(traversed, my_signals=False)
-        for child in self.children:
-            curr_signals, curr_statements = child._gen(traversed)
-            signals += curr_signals
-            statements += curr_statements
-        for left, right in self.constraints:
-            curr_signals, curr_statements = left._gen(traversed)
-            signals += curr_signals
-            statements += curr_statements
-            curr_signals, curr_statements = right._gen(traversed)
-            signals += curr_signals
-            statements += curr_statements
-            statements.append("{} === {};".format(left.fullname, right.fullname))
+    def product(self, xs):
+        """Multiplies the signals (or numbers) in `xs` together as a balanced
+        tree, so that the circuit is only logarithmically deep in their number."""
+        return _balanced(self._operands(xs), operator.mul)
+
+    def select(self, table, index):
+        """Returns `table[index]` for a list of numbers `table`, constraining
+        `index` to be one of its positions."""
+        [value] = self.select_many([table], index)
+        return value
+
+    def select_many(self, tables, index):
+        """Looks up the same `index` in each of the equally long lists of numbers
+        `tables`, returning a list of the selected values. The index is split
+        into bits once, and the products of those bits are shared by every
+        table, each of which is then a linear combination of them."""
+        tables = [list(table) for table in tables]
+        assert tables and all(isinstance(x, int) for table in tables for x in table)
+        length = len(tables[0])
+        if not length or any(len(table) != length for table in tables):
+            raise Exception("tables to select from must have the same nonzero size")
+        if isinstance(index, int):
+            return [self.constant(table[index]) for table in tables]
+        size = (length - 1).bit_length()
+        if not size:
+            index.check_equals(0)
+            return [self.constant(table[0]) for table in tables]
+        bits = self.bits(index, size)
+        monomials = {}
+
+        def monomial(mask):
+            if mask not in monomials:
+                top = mask.bit_length() - 1
+                rest = mask & ~(1 << top)
+                if rest:
+                    monomials[mask] = monomial(rest) * bits[top]
+                else:
+                    monomials[mask] = bits[top]
+            return monomials[mask]
+
+        def combination(values):
+            # the coefficients of the multilinear polynomial in the bits that
+            # takes each of `values` at its index, padded with zeros
+            coeffs = values + [0] * ((1 << size) - len(values))
+            for bit in range(size):
+                for mask in range(1 << size):
+                    if mask & (1 << bit):
+                        coeffs[mask] -= coeffs[mask ^ (1 << bit)]
+            terms = [
+                monomial(mask) * coeff
+                for mask, coeff in enumerate(coeffs)
+                if mask and coeff
+            ]
+            if coeffs[0] or not terms:
+                terms.append(self.constant(coeffs[0]))
+            return self.sum(terms)
+
+        def check_range():
+            # the positions past the end of the tables can't be selected
+            padding = [0] * length + [1] * ((1 << size) - length)
+            combination(padding).check_equals(0)
+            return True
+
+        bounds = index.bounds
+        if length < 1 << size and (bounds is None or bounds[1] >= length):
+            self.intern(("selectable", id(index), length), check_range)
+            index._restrict(0, length - 1)
+        values = []
+        for table in tables:
+            value = combination(table)
+            value._restrict(min(table), max(table))
+            values.append(value)
+        return values
+
+    def bits(self, x, n=None):
+        """Splits the signal `x` into a list of `n` constrained bits, least
+        significant first, which checks that `0 <= x < 2**n`. By default `n` is
+        the smallest width that holds every value `x` can take according to its
+        bounds, or the width of the field if they aren't known. The bits of a
+        signal are only computed once for each width."""
+        assert isinstance(x, Op) and not isinstance(x, Var)
+        if n is None:
+            n = x.bit_width or P.bit_length()
+        assert 0 <= n <= P.bit_length()
+
+        def build():
+            bits = []
+            for i in range(n):
+                bit = self.make(VarBit, x.detach(), self.constant(i)).attach()
+                (bit * (bit - 1)).check_equals(0)
+                bit._restrict(0, 1)
+                bits.append(bit)
+            terms = [bit * (1 << i) for i, bit in enumerate(bits)]
+            self.sum(terms or [0]).check_equals(x)
+            if n < P.bit_length():
+                x._restrict(0, (1 << n) - 1)
+            return bits
+
+        return self.intern(("bits", id(x), n), build)
+
+    def _operands(self, xs):
+        operands = [self.constant(x) if isinstance(x, int) else x for x in xs]
+        if not operands:
+            raise Exception("expected at least one operand")
+        assert all(isinstance(operand, Op) for operand in operands)
+        return operands
+
+    def gen(self, output, params=None, main=True):
+        """Returns the Circom code of the circuit computing `output`. `params`
+        maps the names of params to the values `component main` gives them,
+        instead of their defaults. With `main=False`, the code leaves out the
+        main component, so that it can be included by the files `gen_mains`
+        generates."""
+        return "".join(self._gen_chunks(output, params, main))
+
+    def gen_to(self, output, fp, chunk_size=1 << 16, params=None, main=True):
+        """Writes the same code as `gen(output, params, main)` to the file-like
+        object `fp` as it is generated, in chunks of about `chunk_size`
+        characters, so that the whole text never needs to be held in memory."""
+        chunk = []
+        size = 0
+        for text in self._gen_chunks(output, params, main):
+            chunk.append(text)
+            size += len(text)
+            if size >= chunk_size:
+                fp.write("".join(chunk))
+                chunk = []
+                size = 0
+        fp.write("".join(chunk))
+
+    def gen_mains(self, include, variants):
+        """Returns the code of a main component for each dictionary of param
+        values in `variants`, instantiating the circuit generated with
+        `gen(output, main=False)` into the file `include`. Each can be compiled
+        on its own, without generating the circuit again."""
+        return [
+            'include "{}";\n\n{}'.format(include, self._gen_main(params))
+            for params in variants
+        ]
+
+    def _gen_main(self, params):
+        params = dict(params or {})
+        values = [
+            str(params.pop(param.name, param.val)) for param in self.template_params
+        ]
+        if params:
+            raise Exception("no params named {}".format(", ".join(sorted(params))))
+        return "component main = Main({});".format(", ".join(values))
+
+    def _gen_chunks(self, output, params=None, main=True):
+        """Yields the generated code piece by piece: the includes, the templates
+        made with `Session.template` that the circuit uses, `Main` and, unless
+        `main` is false, the main component."""
+        main = self._gen_main(params) if main else None
+        output, groups = self._plan(output)
+        yield "\n".join('include "{}"'.format(path) for path in self.includes)
+        for template in self._templates(itertools.chain(*groups)):
+            yield "\n\n"
+            with self._scope(template):
+                yield from self._gen_template(
+                    template.name,
+                    template.sink,
+                    template.groups,
+                    template.input_declarations(),
+                    template.output_declarations(),
+                )
+        declaration = "signal output {};".format(output.fullname)
+        if isinstance(output, SignalArray):
+            declaration = "signal output {}[{}];".format(output.fullname, output.length)
+        yield "\n\n"
+        yield from self._gen_template(
+            "Main",
+            output,
+            groups,
+            [],
+            [declaration],
+            [param.name for param in self.template_params],
+        )
+        if main is not None:
+            yield "\n\n" + main
+
+    def _gen_template(self, name, output, groups, inputs, outputs, params=()):
+        """Yields the code of a template computing `output`. Signals are declared
+        in a first walk over the nodes, between the declarations of its `inputs`
+        and `outputs`, and their statements emitted in a second."""
+        output_linear = None
+        if self.fold_linear:
+            output_linear = self._fold(itertools.chain(*groups), output)
+        try:
+            yield "template {}({}) {{\n".format(name, ", ".join(params))
+            for declaration in inputs:
+                yield "    {}\n".format(declaration)
+            for group in groups:
+                for node in group:
+                    if node is output or self._folded(node):
+                        continue
+                    yield self._node_fragments(node, output)[0]
+            for declaration in outputs:
+                yield "    {}\n".format(declaration)
+            yield "\n"
+
+            separator = ""
+            for i, group in enumerate(groups):
+                for node in group:
+                    if self._folded(node):
+                        continue
+                    if node is output and output_linear is not None:
+                        statements = [
+                            "    {} <== {};".format(
+                                output.fullname, output_linear.render()
+                            )
+                        ]
+                        if isinstance(output, SignalArray):
+                            statement = "{} <== {};".format(
+                                output._index_ref("i__"),
+                                output_linear.render(index="i__"),
+                            )
+                            statements = [
+                                textwrap.indent(_loop(output.length, statement), "    ")
+                            ]
+                    else:
+                        statements = self._node_fragments(node, output)[1]
+                    for statement in statements:
+                        yield separator + statement
+                        separator = "\n"
+                if i > 0:
+                    left, right = self.constraints[i - 1]
+                    statement = "{} === {};".format(
+                        self.ref(left, False), self.ref(right, False)
+                    )
+                    yield separator + textwrap.indent(statement, "    ")
+                    separator = "\n"
+            yield "\n}"
+        finally:
+            self._linear, self._quadratic = {}, {}
+
+    def _templates(self, nodes):
+        """Returns the templates instantiated by `nodes`, each after the templates
+        it instantiates itself."""
+        templates = {}
+
+        def visit(nodes):
+            for node in nodes:
+                if isinstance(node, ExternOp) and isinstance(node.extern, Template):
+                    template = node.extern
+                    if id(template) not in templates:
+                        visit(template.order)
+                        templates[id(template)] = template
+
+        visit(nodes)
+        return list(templates.values())
+
+    def _folded(self, node):
+        return id(node) in self._linear or id(node) in self._quadratic
+
+    def _node_fragments(self, node, output):
+        """Returns the indented signal declarations of `node`, as one string, and
+        its indented statements. These depend on how the nodes below it were
+        folded, which only depends on the graph and on the output being
+        generated, so incremental sessions cache them for each output."""
+        cache = self._output_cache(self._fragments, output)
+        entry = cache.get(id(node))
+        if entry is not None and entry[0] is node:
+            return entry[1:]
+        signals = "".join(
+            textwrap.indent(signal, "    ") + "\n" for signal in node._gen_signals()
+        )
+        statements = [
+            textwrap.indent(statement, "    ") for statement in node._gen_statements()
+        ]
+        if self.incremental:
+            cache[id(node)] = (node, signals, statements)
+        return signals, statements
 
-        output_text = "signal output {};".format(output.fullname)
-        signals.append(output_text)
+    def _output_cache(self, caches, output):
+        """Returns the dictionary of `caches` kept for the plan computing
+        `output`. Whether a node is folded depends on whether it's the output,
+        and on how often the nodes of the plan use it, so plans don't share
+        their caches."""
+        entry = caches.get(id(output))
+        if entry is None or entry[0] is not output:
+            entry = caches[id(output)] = (output, {})
+        return entry[1]
+
+    def fingerprint(self, output, names=False):
+        """Returns a hash of the circuit computing `output`: the structure of its
+        graph, its constants, inputs, externs, constraints and includes, but
+        not the names generated for its signals. Circuits with the same
+        fingerprint compile to the same constraints, so it can key a cache of
+        build artifacts such as `knowledgeflow.cache.BuildCache`. With
+        `names=True`, the hash also covers the names of the signals and
+        components, which depend on options like `max_name_length`, so that it
+        can key artifacts that contain them, like the generated code or the
+        `.sym` file."""
+        output, groups = self._plan(output)
+        nodes = list(itertools.chain(*groups))
+        return self._circuit_fingerprint(nodes, output, names)
+
+    def _circuit_fingerprint(self, nodes, output, names=False):
+        """Returns the fingerprint of the planned circuit whose topologically
+        ordered nodes are `nodes`, as described in `fingerprint`."""
+        index = {id(node): i for i, node in enumerate(nodes)}
+        constraints = [
+            (index[id(left._gen_node())], index[id(right._gen_node())])
+            for left, right in self.constraints
+        ]
+        data = (
+            self._fingerprint(nodes, names),
+            index[id(output)],
+            constraints,
+            sorted(self.includes),
+            self.fold_linear,
+        )
+        if names:
+            data += (
+                [
+                    self._fingerprint(template.order, names)
+                    for template in self._templates(nodes)
+                ],
+            )
+        return hashlib.sha256(repr(data).encode()).hexdigest()
+
+    def compute_witness(self, output, inputs):
+        """Evaluates the circuit over the BN254 scalar field, given the values of
+        its inputs keyed by name. Returns the value of every signal in the
+        generated circuit, and of every param of `Main`, keyed by its name.
+        Externs are evaluated with the `evaluator` registered on them."""
+        batch = {name: [value] for name, value in inputs.items()}
+        witness = self.compute_witness_batch(output, batch)
+        return {name: column[0] for name, column in witness.items()}
+
+    def compute_witness_batch(self, output, inputs):
+        """Like `compute_witness`, but evaluates many witnesses at once. `inputs`
+        maps the name of each input to a list of its values, one per witness,
+        and the result maps each signal name to a list of values. Every node is
+        visited once for the whole batch."""
+        sizes = {len(column) for column in inputs.values()}
+        if len(sizes) > 1:
+            raise Exception("all inputs must have the same number of values")
+        size = sizes.pop() if sizes else 1
+        output, groups = self._plan(output)
+        nodes = list(itertools.chain(*groups))
+        values = self._evaluate(nodes, inputs, size)
+        return {
+            node.fullname: values[id(node)]
+            for node in self._witness_nodes(nodes, output)
+        }
+
+    def compile_evaluator(self, output):
+        """Compiles the circuit into a Python function that computes the same
+        witness as `compute_witness(output, inputs)` when called with `inputs`,
+        but without walking the graph. The compiled code is cached on the
+        session by a fingerprint of the graph's structure."""
+        program, names = self._program(output)
+        evaluate = program.load()
+
+        def evaluator(inputs):
+            return dict(zip(names, evaluate(inputs)))
+
+        return evaluator
+
+    def compute_witnesses(self, output, inputs, workers=None, chunk_size=256):
+        """Computes a witness, like `compute_witness`, for every dictionary of
+        input values in the iterable `inputs`, using a pool of `workers`
+        processes (by default, one per CPU). The compiled circuit is sent to each
+        worker once. Yields the witnesses in the order of `inputs`, reading
+        ahead only a few chunks of `chunk_size` inputs at a time."""
+        program, names = self._program(output)
+        inputs = iter(inputs)
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            workers, initializer=_load_program, initargs=(program,)
+        ) as executor:
+            pending = collections.deque()
+
+            def submit():
+                chunk = list(itertools.islice(inputs, chunk_size))
+                if chunk:
+                    pending.append(executor.submit(_run_program, chunk))
+
+            for _ in range(2 * workers):
+                submit()
+            while pending:
+                results = pending.popleft().result()
+                submit()
+                for values in results:
+                    yield dict(zip(names, values))
+
+    def check_witness(self, output, witness):
+        """Checks that `witness`, as returned by `compute_witness`, satisfies
+        every `<==` and `check_equals` in the circuit, and the constraints that
+        the `builder` of every extern adds. Raises an exception describing the
+        first constraint that fails. If the session was created with
+        `track_origins=True`, the exception shows where the failing node or
+        `check_equals` was created."""
+        output, groups = self._plan(output)
+        nodes = list(itertools.chain(*groups))
+        signals = {id(node) for node in self._signals(nodes, output)}
+        columns = {name: [value] for name, value in witness.items()}
+        values = {}
+        for node in nodes:
+            if isinstance(node, (Input, Constant)):
+                [values[id(node)]] = node._compute_leaf(columns, 1)
+                continue
+            args = [values[id(child._gen_node())] for child in node.children]
+            if isinstance(node, ExternOp) and node.extern.builder is not None:
+                values[id(node)] = self._check_extern(node, args)
+                continue
+            [value] = node._compute(*([arg] for arg in args))
+            if id(node) in signals:
+                if node.fullname not in witness:
+                    raise Exception("no value given for {}".format(node.fullname))
+                actual = witness[node.fullname]
+                if isinstance(actual, list):
+                    actual = [element % P for element in actual]
+                else:
+                    actual %= P
+                # the values of hints aren't constrained
+                if not isinstance(node, Var) and actual != value:
+                    raise self._witness_error(
+                        "{} is {}, but should be {}".format(
+                            node.fullname, actual, value
+                        ),
+                        node.origin,
+                    )
+                value = actual
+            values[id(node)] = value
+        for (left, right), origin in zip(self.constraints, self.constraint_origins):
+            left_value = values[id(left._gen_node())]
+            right_value = values[id(right._gen_node())]
+            if left_value != right_value:
+                raise self._witness_error(
+                    "{} is {}, but is checked to equal {}, which is {}".format(
+                        left.fullname, left_value, right.fullname, right_value
+                    ),
+                    origin,
+                )
 
-        main = "\n".join(signals) + "\n\n" + "\n".join(statements)
-        circom = "{}\n\ntemplate Main() {{\n{}\n}}\n\ncomponent main = Main();".format(
-            "\n".join(includes), textwrap.indent(main, "    ")
+    def _check_extern(self, node, args):
+        """Checks the constraints of an extern against the values of its inputs,
+        and returns the values of its outputs."""
+        cs = ConstraintSystem(witness=True)
+        inputs = []
+        for arg in args:
+            if isinstance(arg, list):
+                inputs.append([{cs.wire("in", value): 1} for value in arg])
+            else:
+                inputs.append({cs.wire("in", arg): 1})
+        outputs = node._build(cs, *inputs)
+        for a, b, c in cs.constraints:
+            if cs.value(a) * cs.value(b) % P != cs.value(c):
+                raise self._witness_error(
+                    "a constraint of {} fails".format(node.component_name),
+                    node.origin,
+                )
+        values = {}
+        for name, lc in outputs.items():
+            if isinstance(lc, list):
+                values[name] = [cs.value(item) for item in lc]
+            else:
+                values[name] = cs.value(lc)
+        return values
+
+    def profile(self, output):
+        """Measures the cost of the circuit by the Python code that built it.
+        The session must be created with `track_origins=True`. Every signal,
+        every nonlinear constraint and the estimated cost of every extern is
+        attributed to the call stack that created it. Returns a `Profile`."""
+        costs = self._costs(*self._plan(output))
+        if any(origin is None for origin, *_ in costs):
+            raise Exception("create the session with track_origins=True to profile it")
+        return Profile(costs)
+
+    def _costs(self, output, groups):
+        """Returns the origin of every signal, nonlinear constraint and extern
+        in the circuit, along with the number of each it adds."""
+        nodes = list(itertools.chain(*groups))
+        if self.fold_linear:
+            self._fold(nodes, output)
+        try:
+            costs = []
+            for node in nodes:
+                if isinstance(node, ExternOp):
+                    costs.append((node.origin, 0, 0, node.extern.cost or 0))
+                elif (
+                    not node.passthrough
+                    and id(node) not in self._linear
+                    and id(node) not in self._quadratic
+                ):
+                    size = node.length if isinstance(node, SignalArray) else 1
+                    costs.append((node.origin, size, size * node._nonlinear(), 0))
+            for (left, right), origin in zip(self.constraints, self.constraint_origins):
+                if (
+                    id(left._gen_node()) in self._quadratic
+                    or id(right._gen_node()) in self._quadratic
+                ):
+                    costs.append((origin, 0, 1, 0))
+        finally:
+            self._linear, self._quadratic = {}, {}
+        return costs
+
+    def _witness_error(self, message, origin):
+        if origin is None:
+            message += " (create the session with track_origins=True to see where)"
+        else:
+            message += ", created at:\n" + "".join(traceback.format_list(origin))
+        return Exception(message)
+
+    def to_r1cs(self, output, path):
+        """Writes the constraints of the circuit to `path` in the binary R1CS
+        format read by snarkjs, without going through the circom compiler, along
+        with a `.sym` file naming its wires next to it. Every `<==` becomes a
+        constraint, except for additions and multiplications by constants which
+        are folded into linear combinations, and every `check_equals` becomes an
+        equality. Externs are expanded by the `builder` registered on them."""
+        cs, n_outputs, n_public, n_private = self._constraint_system(output)
+        with open(path, "wb") as fp:
+            write_r1cs(fp, cs, n_outputs, n_public, n_private)
+        with open(os.path.splitext(path)[0] + ".sym", "w") as fp:
+            write_sym(fp, cs)
+
+    def to_wtns(self, output, inputs, path):
+        """Computes the witness of the circuit for the values of its `inputs`,
+        and writes it to `path` in the binary format read by snarkjs, with the
+        wires ordered as in the file written by `to_r1cs`."""
+        cs, _, _, _ = self._constraint_system(output, inputs, constraints=False)
+        with open(path, "wb") as fp:
+            write_wtns(fp, cs.values, len(cs.values))
+
+    def _constraint_system(self, output, inputs=None, constraints=True):
+        """Builds the constraint system of the circuit. If the values of its
+        `inputs` are given, the value of every wire is computed as well, and if
+        `constraints` is false, only the wires are kept. Returns the system
+        along with its number of outputs, public inputs and private inputs."""
+        output, groups = self._plan(output)
+        nodes = list(itertools.chain(*groups))
+        cs = ConstraintSystem(witness=inputs is not None, constraints=constraints)
+        if isinstance(output, SignalArray):
+            outs = [
+                cs.wire(cs.label("{}[{}]".format(output.fullname, i)))
+                for i in range(output.length)
+            ]
+        else:
+            outs = [cs.wire(cs.label(output.fullname))]
+        lcs = {}
+        counts = []
+        for private in (False, True):
+            leaves = [
+                node
+                for node in nodes
+                if isinstance(node, Input) and node.private == private
+            ]
+            wires = len(cs.labels)
+            for node in leaves:
+                value = None
+                if inputs is not None:
+                    [value] = node._compute_leaf(
+                        {name: [value] for name, value in inputs.items()}, 1
+                    )
+                lcs[id(node)] = node._build_leaf(cs, value)
+            counts.append(len(cs.labels) - wires)
+        _build_nodes(cs, nodes, self.constraints, lcs, [output])
+        results = lcs[id(output)]
+        if not isinstance(output, SignalArray):
+            results = [results]
+        for out, lc in zip(outs, results):
+            if inputs is not None:
+                cs.values[out] = cs.value(lc)
+            cs.constrain_equal({out: 1}, lc)
+        return cs, len(outs), counts[0], counts[1]
+
+    def _program(self, output):
+        """Returns the compiled program for the circuit, along with the names of
+        the signals it computes."""
+        output, groups = self._plan(output)
+        nodes = list(itertools.chain(*groups))
+        # the signals depend on the constraints and on fold_linear too
+        fingerprint = self._circuit_fingerprint(nodes, output)
+        program = self.evaluators.get(fingerprint)
+        if program is None:
+            program = self.evaluators[fingerprint] = self._compile(nodes, output)
+        names = [node.fullname for node in self._witness_nodes(nodes, output)]
+        assert program.size == len(names)
+        return program, names
+
+    def _compile(self, nodes, output):
+        namespace = {}
+        bound = {}
+
+        def bind(obj):
+            """Makes `obj` available to the compiled code under the returned name."""
+            if id(obj) not in bound:
+                name = bound[id(obj)] = "_{}".format(len(bound))
+                namespace[name] = obj
+            return bound[id(obj)]
+
+        refs = {}
+        lines = ["def evaluate(inputs):"]
+        for i, node in enumerate(nodes):
+            args = [refs[id(child._gen_node())] for child in node.children]
+            expression = node._compile(bind, *args)
+            if isinstance(node, Constant):
+                refs[id(node)] = expression
+            else:
+                refs[id(node)] = "v{}".format(i)
+                lines.append("    v{} = {}".format(i, expression))
+        signals = [refs[id(node)] for node in self._witness_nodes(nodes, output)]
+        lines.append("    return ({})".format("".join(ref + ", " for ref in signals)))
+        return Program("\n".join(lines), namespace, len(signals))
+
+    def _fingerprint(self, nodes, names=False):
+        """Hashes the structure of the graph formed by `nodes`, which must be
+        topologically ordered, independently of the names of its signals unless
+        `names` is true."""
+        index = {}
+        digest = hashlib.sha256()
+        for i, node in enumerate(nodes):
+            index[id(node)] = i
+            children = [index[id(child._gen_node())] for child in node.children]
+            data = (type(node).__name__, children, node._fingerprint())
+            if names:
+                if isinstance(node, ExternOp):
+                    data += (node.component_name,)
+                else:
+                    data += (node.fullname,)
+            digest.update(repr(data).encode())
+        return digest.hexdigest()
+
+    def _signals(self, nodes, output):
+        """Returns the nodes that get a signal in the generated circuit."""
+        if self.fold_linear:
+            self._fold(nodes, output)
+        try:
+            return [
+                node
+                for node in nodes
+                if not node.passthrough
+                and id(node) not in self._linear
+                and id(node) not in self._quadratic
+            ]
+        finally:
+            self._linear, self._quadratic = {}, {}
+
+    def _witness_nodes(self, nodes, output):
+        """Returns the nodes whose values a witness records: the signals, and the
+        params of `Main`, so that the witness is checked with the values of the
+        params it was computed with."""
+        params = [node for node in nodes if isinstance(node, TemplateParam)]
+        return params + self._signals(nodes, output)
+
+    def _evaluate(self, nodes, inputs, size):
+        """Computes a column of `size` values for every node in `nodes`, which
+        must be topologically ordered."""
+        values = {}
+        for node in nodes:
+            if isinstance(node, (Input, Constant)):
+                values[id(node)] = node._compute_leaf(inputs, size)
+            else:
+                args = [values[id(child._gen_node())] for child in node.children]
+                values[id(node)] = node._compute(*args)
+        return values
+
+    def _plan(self, output):
+        """Orders the nodes reachable from `output`, the externs and the
+        constraints so that every node comes after its children. Nodes first
+        reached from each constraint are grouped together."""
+        if self.incremental:
+            if self._cached_fold_linear != self.fold_linear:
+                self._combinations, self._fragments = {}, {}
+                self._cached_fold_linear = self.fold_linear
+            plan = self._plans.get(id(output))
+            if plan is not None and plan[0] is output:
+                _, planned, children, groups, traversed = plan
+                if children == len(self.children):
+                    # constraints are only ever appended, so the walk carries on
+                    for left, right in self.constraints[len(groups) - 1 :]:
+                        groups.append(list(self._topological([left, right], traversed)))
+                    return planned, self._fuse(groups)
+        root = output
+        if output.passthrough:
+            if isinstance(output, SignalArray):
+                raise Exception(
+                    "the slice {} can't be the output of a circuit; output a copy "
+                    "of it, like {} * 1".format(output.fullname, output.fullname)
+                )
+            output = self.make(IdentityOp, output)
+        groups, traversed = self._walk(output)
+        if self.incremental:
+            self._plans[id(root)] = (
+                root, output, len(self.children), groups, traversed
+            )
+        return output, self._fuse(groups)
+
+    def _fuse(self, groups):
+        """With `fuse_externs`, replaces the externs of `Main` that have a `merge`
+        hook by a single batched instance, and declares the instances of each
+        other template as an array of components, created by a single loop.
+        Both are named after the first instance they replace. Returns the new
+        groups of nodes."""
+        if not self.fuse_externs:
+            # undo the arrays of an earlier generation with fuse_externs on
+            unfused = False
+            for node in itertools.chain(*groups):
+                if isinstance(node, ExternOp) and node.array is not None:
+                    node.array = None
+                    unfused = True
+            if self.incremental and unfused:
+                self._fragments = {}
+                self._fused_layout = None
+            return groups
+        batches = {}
+        for node in groups[0]:
+            if (
+                isinstance(node, ExternOp)
+                and node.extern.merge is not None
+                and node.extern.output is None
+            ):
+                key = (node.extern_name, node.extern.merge)
+                batches.setdefault(key, []).append(node)
+        replacements = {}
+        for members in batches.values():
+            if len(members) < 2:
+                continue
+            key = ("merged",) + tuple(id(member) for member in members)
+            merged = self.intern(key, lambda: self._merge_externs(members))
+            if merged is None:
+                continue
+            for member in members:
+                replacements[id(member)] = None
+            replacements[id(members[-1])] = merged
+        if replacements:
+            fused = [replacements.get(id(node), node) for node in groups[0]]
+            groups = [[node for node in fused if node is not None]] + groups[1:]
+
+        instances = {}
+        for node in itertools.chain(*groups):
+            if isinstance(node, ExternOp):
+                key = (node.extern_name, repr(node.args), node.extern.fingerprint())
+                instances.setdefault(key, []).append(node)
+        layout = []
+        for members in instances.values():
+            # named after the first call, which the signals computed from the
+            # outputs of the calls are usually named after too
+            array = members[0].instance_name if len(members) > 1 else None
+            for i, member in enumerate(members):
+                member.array = None if array is None else (array, i, len(members))
+                layout.append((id(member), member.array))
+        if self.incremental and layout != self._fused_layout:
+            # the generated code of externs and their users names the components
+            self._fragments = {}
+            self._fused_layout = layout
+        return groups
+
+    def _merge_externs(self, members):
+        """Returns a single instance of the extern of `members` doing the work of
+        all of them, built by the extern's `merge` hook, or None if it can't."""
+        extern = members[0].extern
+        calls = []
+        for member in members:
+            inputs = {}
+            for name, value in member.assignments:
+                if isinstance(value, ExternArray):
+                    return None
+                if isinstance(value, SignalArray):
+                    name, value = name[0], list(value)
+                inputs[name] = value
+            calls.append((list(member.args), inputs))
+        merged = extern.merge(calls)
+        if merged is None:
+            return None
+        args, inputs = merged
+        cost = None
+        if extern.name not in circomlib.BUILTINS:
+            costs = [member.extern.cost for member in members]
+            cost = None if None in costs else sum(costs)
+        merged_extern = Extern(
+            self,
+            extern.name,
+            {
+                name: [len(value)] if isinstance(value, list) else 1
+                for name, value in inputs.items()
+            },
+            None,
+            args,
+            evaluator=extern.evaluator,
+            cost=cost,
+            builder=extern.builder,
+        )
+        children = []
+        for value in inputs.values():
+            children.extend(value if isinstance(value, list) else [value])
+        return ExternOp(
+            self,
+            merged_extern,
+            children,
+            list(inputs.items()),
+            instance_name=members[0].instance_name,
         )
-        return circom
+
+    def _component_name(self, base):
+        """Returns a new component name starting with `base`."""
+        suffix = self.component_suffixes.get(base, 0)
+        name = "{}_{}".format(base, suffix)
+        while name in self.component_names:
+            suffix += 1
+            name = "{}_{}".format(base, suffix)
+        self.component_suffixes[base] = suffix + 1
+        self.component_names.add(name)
+        return name
+
+    def _walk(self, output):
+        traversed = set()
+        groups = [list(self._topological([output] + self.children, traversed))]
+        for left, right in self.constraints:
+            groups.append(list(self._topological([left, right], traversed)))
+        return groups, traversed
+
+    def _fold(self, order, output):
+        """Collapses additions, subtractions and multiplications by constants into
+        linear combinations of the signals they are computed from, so that they
+        don't need signals of their own. Multiplications that are only compared
+        against a linear expression by `check_equals` are inlined into the
+        constraint. Returns the linear combination of the output, if it has one.
+
+        Incremental sessions keep the linear combinations of each output between
+        calls, and only compute those of new nodes, and of the nodes they refer
+        to whose combination was reused by their only user."""
+        order = list(order)
+        uses = {}
+        constrained = {}
+
+        def use(node, counts):
+            key = id(node._gen_node())
+            counts[key] = counts.get(key, 0) + 1
+
+        use(output, uses)
+        for node in order:
+            for child in node.children:
+                use(child, uses)
+        for left, right in self.constraints:
+            for side in (left, right):
+                use(side, uses)
+                use(side, constrained)
+
+        cache = {}
+        if self.incremental:
+            cache = self._output_cache(self._combinations, output)
+
+        def cached(node):
+            entry = cache.get(id(node))
+            if entry is None or entry[0] is not node:
+                return None
+            return entry
+
+        needed = None
+        if self.incremental:
+            needed = {id(node) for node in order if cached(node) is None}
+            needed.add(id(output))
+            for left, right in self.constraints:
+                needed.add(id(left._gen_node()))
+                needed.add(id(right._gen_node()))
+            for node in reversed(order):
+                if id(node) in needed:
+                    for child in node.children:
+                        child = child._gen_node()
+                        entry = cached(child)
+                        if entry is not None and entry[1] is _REUSED:
+                            needed.add(id(child))
+
+        computed = {}
+        reused = set()
+
+        def peek(node):
+            node = node._gen_node()
+            combination = self._linear.get(id(node))
+            if combination is None:
+                return LinearCombination.of(node)
+            return combination
+
+        def own(node):
+            node = node._gen_node()
+            combination = self._linear.get(id(node))
+            if combination is None:
+                return LinearCombination.of(node)
+            if uses[id(node)] == 1 and id(node) in computed:
+                # nobody else refers to this node, so its terms can be reused
+                reused.add(id(node))
+                return combination
+            return combination.copy()
+
+        output_linear = None
+        for node in order:
+            entry = cached(node)
+            if entry is not None and entry[1] is not _REUSED:
+                combination = entry[1]
+            elif needed is None or id(node) in needed:
+                combination = node._linearize(peek, own)
+                computed[id(node)] = (node, combination)
+            else:
+                # folded into its only user, whose combination is cached
+                self._linear[id(node)] = None
+                continue
+            if node is output:
+                output_linear = combination
+            elif combination is not None:
+                self._linear[id(node)] = combination
+            elif isinstance(node, Mul) and uses[id(node)] == 1:
+                if constrained.get(id(node)) != 1:
+                    continue
+                [left, right] = node.children
+                self._quadratic[id(node)] = (peek(left), peek(right))
+
+        # a constraint can only multiply on one side
+        for left, right in self.constraints:
+            left, right = left._gen_node(), right._gen_node()
+            if id(left) in self._quadratic:
+                self._quadratic.pop(id(right), None)
+
+        if self.incremental:
+            for key, (node, combination) in computed.items():
+                cache[key] = (node, _REUSED if key in reused else combination)
+        return output_linear
+
+    def ref(self, node, parenthesize=True):
+        """Returns the expression that refers to the value of `node` in the
+        statements being generated."""
+        node = node._gen_node()
+        combination = self._linear.get(id(node))
+        if combination is not None:
+            return combination.render(parenthesize)
+        factors = self._quadratic.get(id(node))
+        if factors is not None:
+            left, right = factors
+            return "{} * {}".format(
+                left.render(parenthesize=True), right.render(parenthesize=True)
+            )
+        return node.fullname
+
+    def _topological(self, roots, traversed):
+        """Yields every node reachable from `roots` after all of its children,
+        visiting each node once. Uses an explicit stack so that arbitrarily deep
+        graphs don't hit the recursion limit."""
+        stack = [(root._gen_node(), False) for root in reversed(roots)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                yield node
+                continue
+            if id(node) in traversed:
+                continue
+            traversed.add(id(node))
+            stack.append((node, True))
+            for child in reversed(node.children):
+                child = child._gen_node()
+                if id(child) not in traversed:
+                    stack.append((child, False))
 
     def include(self, path):
         self.includes.add(path)
 
-    def extern(self, name, inputs, output=None, args=[]):
-        return Extern(self, name, inputs, output, args)
+    def extern(
+        self,
+        name,
+        inputs,
+        output=None,
+        args=[],
+        pure=False,
+        evaluator=None,
+        cost=None,
+        builder=None,
+        merge=None,
+    ):
+        """Declares an external Circom template. Pass `pure=True` if the template
+        has no side effects, so that repeated calls with the same inputs share a
+        single component.
+
+        `evaluator` computes the template's outputs in Python: it is called as
+        `evaluator(args, inputs)` with a dictionary of input values, and returns a
+        dictionary of output values. `cost` estimates the number of constraints
+        each instance adds. `builder` adds the template's constraints for
+        `to_r1cs`.
+
+        `merge` lets sessions created with `fuse_externs=True` replace several
+        instances of a template without outputs by a single one. It is called as
+        `merge(calls)` with a list of the static arguments and the dictionary of
+        input signals of each instance, and returns those of the instance
+        replacing them, or None if they can't be merged. All four default to the
+        built-in models in `knowledgeflow.circomlib` for the circomlib templates
+        it knows."""
+        return Extern(
+            self, name, inputs, output, args, pure, evaluator, cost, builder, merge
+        )
+
+    def template(self, function):
+        """Decorator that turns a Python function building part of a circuit into
+        a Circom template, so that its code is generated once however many times
+        it's called. Arguments that are signals, or lists or tuples of signals,
+        become the template's inputs, and every other argument is static: the
+        function is traced once for each combination of static arguments it's
+        called with. It must return a signal, a list or tuple of signals, or
+        None, and can't refer to signals from outside of it other than through
+        its arguments. Each call instantiates the template as a component."""
+        variants = {}
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            arguments = inspect.signature(function).bind(*args, **kwargs)
+            arguments.apply_defaults()
+            key = tuple(
+                (name, _signal_shape(value) or ("static", _static_key(value)))
+                for name, value in arguments.arguments.items()
+            )
+            template = variants.get(key)
+            if template is None:
+                template = variants[key] = Template(self, function, arguments)
+            return template.call(arguments)
+
+        return call
+
+    @contextlib.contextmanager
+    def _scope(self, template, tracing=False):
+        """Swaps in the constraints, externs, nodes and names of `template`, so
+        that the session builds or generates the template's body."""
+        attributes = [
+            "constraints",
+            "constraint_origins",
+            "children",
+            "nodes",
+            "names",
+            "name_suffixes",
+        ]
+        saved = [getattr(self, attribute) for attribute in attributes]
+        saved_tracing = self.tracing
+        try:
+            for attribute in attributes:
+                setattr(self, attribute, getattr(template, attribute))
+            if tracing:
+                self.tracing = template
+            yield
+        finally:
+            for attribute, value in zip(attributes, saved):
+                setattr(self, attribute, value)
+            self.tracing = saved_tracing
 
     def cond(self, pred, left, right):
-        return VarCond(pred, left, right)
+        return self.make(VarCond, pred, left, right)
+
+    def op_name(self, op, *operands):
+        """Builds the name of a signal computed by `op` from `operands`. Names are
+        truncated to `max_name_length` unless the session was created with
+        `debug_names=True`, in which case they describe the full expression."""
+        if len(operands) == 1:
+            name = "{}_{}".format(op, operands[0].name)
+        else:
+            name = "_{}_".format(op).join(operand.name for operand in operands)
+        if not self.debug_names:
+            name = name[: self.max_name_length]
+        return name
+
+
+# marks a cached linear combination that was reused by the only node using it
+_REUSED = object()
+# marks bounds that haven't been inferred yet
+_UNKNOWN = object()
+
+
+class Program:
+    """Python source code computing a witness, along with the objects it refers
+    to, and the number of values it returns. Programs can be pickled to send
+    them to other processes as long as those objects can."""
+    def __init__(self, source, namespace, size):
+        self.source = source
+        self.namespace = namespace
+        self.size = size
+        self.evaluate = None
+
+    def load(self):
+        if self.evaluate is None:
+            namespace = {"P": P, "inverse": inverse}
+            namespace.update(self.namespace)
+            exec(compile(self.source, "<knowledgeflow>", "exec"), namespace)
+            self.evaluate = namespace["evaluate"]
+        return self.evaluate
+
+    def __getstate__(self):
+        return {
+            "source": self.source,
+            "namespace": self.namespace,
+            "size": self.size,
+            "evaluate": None,
+        }
+
+
+class Profile:
+    """The signals, nonlinear constraints and estimated extern constraints of a
+    circuit, totalled by the call stacks that created them."""
+    COLUMNS = ("signals", "constraints", "extern_cost", "total")
+
+    def __init__(self, costs):
+        self.stacks = {}
+        for origin, signals, constraints, extern_cost in costs:
+            stack = tuple(_frame_name(frame) for frame in origin)
+            totals = self.stacks.setdefault(stack, [0, 0, 0, 0])
+            totals[0] += signals
+            totals[1] += constraints
+            totals[2] += extern_cost
+            totals[3] += constraints + extern_cost
+
+    def functions(self):
+        """Returns the totals of every function, including the functions it calls,
+        from the most to the least constraints."""
+        functions = {}
+        for stack, totals in self.stacks.items():
+            for function in set(stack):
+                row = functions.setdefault(function, [0, 0, 0, 0])
+                for i, total in enumerate(totals):
+                    row[i] += total
+        return sorted(functions.items(), key=lambda item: (-item[1][3], item[0]))
+
+    def table(self):
+        lines = ["{:>10} {:>12} {:>12} {:>12}  function".format(*self.COLUMNS)]
+        for function, totals in self.functions():
+            lines.append("{:>10} {:>12} {:>12} {:>12}  {}".format(*totals, function))
+        return "\n".join(lines)
+
+    def write_collapsed(self, fp, column="total"):
+        """Writes the totals of `column` by call stack to `fp` in the collapsed
+        format read by flamegraph.pl and speedscope."""
+        index = self.COLUMNS.index(column)
+        for stack, totals in sorted(self.stacks.items()):
+            if totals[index]:
+                fp.write("{} {}\n".format(";".join(stack), totals[index]))
+
+
+def _frame_name(frame):
+    name = "{}:{}".format(os.path.basename(frame.filename), frame.name)
+    return name.replace(" ", "_").replace(";", "_")
+
+
+_worker_program = None
+
+
+def _load_program(program):
+    global _worker_program
+    _worker_program = program.load()
+
+
+def _run_program(chunk):
+    return [_worker_program(inputs) for inputs in chunk]
+
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _origin():
+    """Returns the current Python stack, without KnowledgeFlow's own frames."""
+    return [
+        frame
+        for frame in traceback.extract_stack()
+        if os.path.dirname(os.path.abspath(frame.filename)) != _PACKAGE_DIR
+    ]
+
+
+def _build_nodes(cs, nodes, constraints, lcs, roots):
+    """Adds the wires of `nodes`, which must be topologically ordered, and the
+    `constraints` between them to `cs`, storing the linear combination of each
+    node in `lcs`. Like the generated code, a multiplication that is only used
+    by a constraint becomes that constraint rather than getting a wire."""
+    uses = collections.Counter(id(root._gen_node()) for root in roots)
+    for node in nodes:
+        for child in node.children:
+            uses[id(child._gen_node())] += 1
+    for left, right in constraints:
+        uses[id(left._gen_node())] += 1
+        uses[id(right._gen_node())] += 1
+    inlined = set()
+    for left, right in constraints:
+        for side in (left._gen_node(), right._gen_node()):
+            if isinstance(side, Mul) and uses[id(side)] == 1:
+                inlined.add(id(side))
+                break
+
+    for node in nodes:
+        if id(node) not in lcs and id(node) not in inlined:
+            args = [lcs[id(child._gen_node())] for child in node.children]
+            lcs[id(node)] = node._build(cs, *args)
+    for left, right in constraints:
+        left, right = left._gen_node(), right._gen_node()
+        if id(right) in inlined:
+            left, right = right, left
+        if id(left) in inlined:
+            a, b = (lcs[id(child._gen_node())] for child in left.children)
+            if lc_constant(a) is None and lc_constant(b) is None:
+                cs.constrain(a, b, lcs[id(right)])
+                continue
+            lcs[id(left)] = left._build(cs, a, b)
+        cs.constrain_equal(lcs[id(left)], lcs[id(right)])
+
+
+def _interval(low, high):
+    """Returns the bounds `(low, high)`, or None if the values in between can't
+    be told apart from their negations in the field."""
+    if low < -(P // 2) or high > P // 2:
+        return None
+    return (low, high)
+
+
+def _add_bounds(left, right, scale=1):
+    """Returns the bounds of `left + scale * right`."""
+    if left is None or right is None:
+        return None
+    ends = (right[0] * scale, right[1] * scale)
+    return _interval(left[0] + min(ends), left[1] + max(ends))
+
+
+def _mul_bounds(left, right):
+    if left is None or right is None:
+        return None
+    products = [a * b for a in left for b in right]
+    return _interval(min(products), max(products))
+
+
+def _balanced(operands, combine):
+    """Combines `operands` pairwise, level by level, into a tree of depth
+    logarithmic in their number."""
+    while len(operands) > 1:
+        paired = [
+            combine(left, right) for left, right in zip(operands[::2], operands[1::2])
+        ]
+        if len(operands) % 2:
+            paired.append(operands[-1])
+        operands = paired
+    return operands[0]
 
 
 class Extern:
-    def __init__(self, sess, name, inputs, output, args):
+    def __init__(
+        self,
+        sess,
+        name,
+        inputs,
+        output,
+        args,
+        pure=False,
+        evaluator=None,
+        cost=None,
+        builder=None,
+        merge=None,
+    ):
         self.sess = sess
         self.name = name
         self.inputs = inputs
@@ -77,6 +1421,21 @@ class Extern:
         elif output is not None:
             assert isinstance(output, str)
         self.args = args
+        self.pure = pure
+        builtin = circomlib.BUILTINS.get(self.name)
+        if builtin is not None:
+            if evaluator is None:
+                evaluator = builtin.evaluate
+            if cost is None:
+                cost = builtin.cost(args)
+            if builder is None:
+                builder = builtin.build
+            if merge is None:
+                merge = builtin.merge
+        self.evaluator = evaluator
+        self.cost = cost
+        self.builder = builder
+        self.merge = merge
 
     def strip_underscores(self, kwargs):
         new_kwargs = {}
@@ -106,7 +1465,10 @@ class Extern:
                         children.append(child)
                     assignments.append((name, arg))
                 else:
-                    assert isinstance(arg, ExternArray)
+                    assert isinstance(arg, (ExternArray, SignalArray))
+                    if isinstance(arg, SignalArray):
+                        assert arg.length == typ[0]
+                        assert arg.sess is self.sess
                     assignments.append(((name, typ[0]), arg))
                     children.append(arg)
             else:
@@ -116,16 +1478,251 @@ class Extern:
                 assert arg.sess is self.sess
                 children.append(arg)
                 assignments.append((name, arg))
-        extern_op = ExternOp(self.sess, self.name, children, assignments, self.args)
-        self.sess.add_child(extern_op)
+        if self.pure and self.sess.cse:
+            key = (
+                ExternOp,
+                self.name,
+                tuple(self.args),
+                self.assignments_key(assignments),
+            )
+            extern_op = self.sess.intern(
+                key, lambda: self.instantiate(children, assignments)
+            )
+        else:
+            extern_op = self.instantiate(children, assignments)
 
         if isinstance(self.output, list):
-            return ExternArray(extern_op, self.output[0])
+            return self.sess.make(ExternArray, extern_op, self.output[0])
         elif isinstance(self.output, str):
-            return ExternOutput(extern_op, self.output)
+            return self.sess.make(ExternOutput, extern_op, self.output)
         else:
             return None
 
+    def instantiate(self, children, assignments):
+        extern_op = ExternOp(self.sess, self, children, assignments)
+        self.sess.add_child(extern_op)
+        return extern_op
+
+    def fingerprint(self):
+        """Returns what identifies the template besides its name and arguments."""
+        return ()
+
+    def assignments_key(self, assignments):
+        key = []
+        for name, args in assignments:
+            if isinstance(args, list):
+                key.append((name, tuple(id(arg) for arg in args)))
+            else:
+                key.append((name, id(args)))
+        return tuple(key)
+
+
+CIRCOM_KEYWORDS = {
+    "signal", "input", "output", "public", "template", "component", "var",
+    "function", "return", "if", "else", "for", "while", "do", "log", "assert",
+    "include", "pragma", "main", "parallel", "custom", "bus",
+}
+
+
+def _signal_shape(value):
+    """Returns the shape of a template argument that is a signal or a list or
+    tuple of signals, or None if the argument is static."""
+    if isinstance(value, SignalArray):
+        raise Exception("pass arrays to templates as lists, like list(array)")
+    if isinstance(value, Op):
+        return "signal"
+    if isinstance(value, (list, tuple)) and any(isinstance(v, Op) for v in value):
+        return (type(value).__name__, len(value))
+    return None
+
+
+def _static_key(value):
+    if isinstance(value, list):
+        return ("list", tuple(_static_key(item) for item in value))
+    if isinstance(value, tuple):
+        return ("tuple", tuple(_static_key(item) for item in value))
+    try:
+        hash(value)
+    except TypeError:
+        raise Exception("static template argument {!r} isn't hashable".format(value))
+    return value
+
+
+class Template(Extern):
+    """A Python function traced into a Circom template of its own. It's used
+    like an extern, with its own evaluator, cost and constraint builder."""
+    def __init__(self, sess, function, arguments):
+        base = function.__name__
+        if base in CIRCOM_KEYWORDS:
+            base += "_"
+        name = base
+        suffix = 0
+        while name in sess.template_names:
+            suffix += 1
+            name = "{}_v{}".format(base, suffix)
+        sess.template_names.add(name)
+
+        self.constraints = []
+        self.constraint_origins = []
+        self.children = []
+        self.nodes = {}
+        self.names = set()
+        self.name_suffixes = {}
+        self.params = []
+        inputs = {}
+        with sess._scope(self, tracing=True):
+            traced = dict(arguments.arguments)
+            for param, value in arguments.arguments.items():
+                shape = _signal_shape(value)
+                if shape is None:
+                    continue
+                input_name = param.lstrip("_")
+                if input_name in CIRCOM_KEYWORDS:
+                    input_name += "_"
+                if shape == "signal":
+                    node = TemplateInput(sess, input_name, input_name)
+                    inputs[input_name] = 1
+                    traced[param] = node
+                else:
+                    node = [
+                        TemplateInput(
+                            sess, "{}_{}".format(input_name, i), "{}[{}]".format(
+                                input_name, i
+                            )
+                        )
+                        for i in range(len(value))
+                    ]
+                    inputs[input_name] = [len(value)]
+                    traced[param] = type(value)(node)
+                self.params.append((param, input_name, node))
+            result = function(**traced)
+
+            if result is None:
+                outputs, output = [], None
+            elif isinstance(result, (list, tuple)):
+                outputs, output = list(result), ["out"]
+            else:
+                outputs, output = [result], "out"
+            outputs = [
+                sess.constant(out) if isinstance(out, int) else out for out in outputs
+            ]
+            for out in outputs:
+                assert isinstance(out, Op)
+            self.result_type = type(result)
+            self.outputs = outputs
+            self.sink = TemplateOutputs(sess, outputs, isinstance(output, list))
+            self.groups, _ = sess._walk(self.sink)
+            self.order = list(itertools.chain(*self.groups))
+            for node in self.order:
+                if node.template is not self and (
+                    not isinstance(node, Constant) or isinstance(node, TemplateParam)
+                ):
+                    raise Exception(
+                        "template {} uses {}, which was computed outside of it; "
+                        "pass it as an argument instead".format(name, node.fullname)
+                    )
+            cost = sum(
+                constraints + extern_cost
+                for _, _, constraints, extern_cost in sess._costs(
+                    self.sink, self.groups
+                )
+            )
+            index = {id(node): i for i, node in enumerate(self.order)}
+            self.structure = hashlib.sha256(
+                repr(
+                    (
+                        sess._fingerprint(self.order),
+                        [
+                            (index[id(left._gen_node())], index[id(right._gen_node())])
+                            for left, right in self.constraints
+                        ],
+                        inputs,
+                        output,
+                    )
+                ).encode()
+            ).hexdigest()
+
+        super().__init__(
+            sess,
+            name,
+            inputs,
+            output,
+            [],
+            pure=True,
+            evaluator=self.evaluate,
+            cost=cost,
+            builder=self.build,
+        )
+
+    def call(self, arguments):
+        kwargs = {}
+        for param, input_name, _ in self.params:
+            value = arguments.arguments[param]
+            kwargs[input_name] = list(value) if isinstance(value, tuple) else value
+        result = self(**kwargs)
+        if self.result_type is type(None):
+            return None
+        if issubclass(self.result_type, (list, tuple)):
+            return self.result_type(result[i] for i in range(len(self.outputs)))
+        return result
+
+    def fingerprint(self):
+        return (self.structure,)
+
+    def input_declarations(self):
+        declarations = []
+        for _, input_name, node in self.params:
+            if isinstance(node, list):
+                declarations.append(
+                    "signal input {}[{}];".format(input_name, len(node))
+                )
+            else:
+                declarations.append("signal input {};".format(input_name))
+        return declarations
+
+    def output_declarations(self):
+        if isinstance(self.output, list):
+            return ["signal output out[{}];".format(len(self.outputs))]
+        if self.output is not None:
+            return ["signal output out;"]
+        return []
+
+    def evaluate(self, args, inputs):
+        columns = {}
+        for _, input_name, node in self.params:
+            if isinstance(node, list):
+                for element, value in zip(node, inputs[input_name]):
+                    columns[element.name] = [value]
+            else:
+                columns[node.name] = [inputs[input_name]]
+        values = self.sess._evaluate(self.order, columns, 1)
+        outs = [values[id(out._gen_node())][0] for out in self.outputs]
+        if isinstance(self.output, list):
+            return {"out": outs}
+        if self.output is not None:
+            return {"out": outs[0]}
+        return {}
+
+    def build(self, cs, args, inputs, prefix):
+        lcs = {}
+        for _, input_name, node in self.params:
+            if isinstance(node, list):
+                for element, lc in zip(node, inputs[input_name]):
+                    lcs[id(element)] = lc
+            else:
+                lcs[id(node)] = inputs[input_name]
+        scope, cs.scope = cs.scope, prefix
+        try:
+            _build_nodes(cs, self.order, self.constraints, lcs, self.outputs)
+        finally:
+            cs.scope = scope
+        outs = [lcs[id(out._gen_node())] for out in self.outputs]
+        if isinstance(self.output, list):
+            return {"out": outs}
+        if self.output is not None:
+            return {"out": outs[0]}
+        return {}
+
 
 class Op:
     def __init__(self, sess, children, name, passthrough=False):
@@ -134,68 +1731,66 @@ class Op:
         self.constraints = []
         self.name = name
         if not passthrough and self.fullname in sess.names:
-            suffix = 0
+            suffix = sess.name_suffixes.get(name, 0)
+            self.name = "{}_{}".format(name, suffix)
             while self.fullname in sess.names:
-                self.name = "{}_{}".format(name, suffix)
                 suffix += 1
+                self.name = "{}_{}".format(name, suffix)
+            sess.name_suffixes[name] = suffix + 1
         if not passthrough:
             sess.names.add(self.fullname)
         self.passthrough = passthrough
+        self.origin = _origin() if sess.track_origins else None
+        self.template = sess.tracing
+        self._bounds = _UNKNOWN
 
     def __add__(self, other):
         if isinstance(other, int):
-            return Add(self, Constant(self.sess, other))
+            return self.sess.make(Add, self, self.sess.constant(other))
         assert isinstance(other, Op)
+        if isinstance(other, SignalArray):
+            return self.sess.make(ArrayAdd, self, other)
         if isinstance(other, Var):
-            return VarAdd(self, other)
+            return self.sess.make(VarAdd, self, other)
         else:
-            return Add(self, other)
+            return self.sess.make(Add, self, other)
 
     def __sub__(self, other):
         if isinstance(other, int):
-            return Sub(self, Constant(self.sess, other))
+            return self.sess.make(Sub, self, self.sess.constant(other))
         assert isinstance(other, Op)
+        if isinstance(other, SignalArray):
+            return self.sess.make(ArraySub, self, other)
         if isinstance(other, Var):
-            return VarSub(self, other)
+            return self.sess.make(VarSub, self, other)
         else:
-            return Sub(self, other)
+            return self.sess.make(Sub, self, other)
 
     def __mul__(self, other):
         if isinstance(other, int):
-            return Mul(self, Constant(self.sess, other))
+            return self.sess.make(Mul, self, self.sess.constant(other))
         assert isinstance(other, Op)
+        if isinstance(other, SignalArray):
+            return self.sess.make(ArrayMul, self, other)
         if isinstance(other, Var):
-            return VarMul(self, other)
+            return self.sess.make(VarMul, self, other)
         else:
-            return Mul(self, other)
+            return self.sess.make(Mul, self, other)
 
     def __truediv__(self, other):
         assert isinstance(other, Var)
-        return VarDiv(self, other)
+        return self.sess.make(VarDiv, self, other)
 
     def __mod__(self, other):
         assert isinstance(other, Var)
-        return VarMod(self, other)
+        return self.sess.make(VarMod, self, other)
 
     @property
     def fullname(self):
         return "{}__".format(self.name)
 
-    def _gen(self, traversed, my_signals=True):
-        self.generated = True
-        if id(self) in traversed:
-            return [], []
-        traversed.add(id(self))
-        signals = []
-        statements = []
-        for child in self.children:
-            curr_signals, curr_statements = child._gen(traversed)
-            signals += curr_signals
-            statements += curr_statements
-        if my_signals:
-            signals += self._gen_signals()
-        statements += self._gen_statements()
-        return signals, statements
+    def _gen_node(self):
+        return self
 
     def _gen_signals(self):
         signal = "signal {};".format(self.fullname)
@@ -204,36 +1799,109 @@ class Op:
     def _gen_statements(self):
         return []
 
+    def _linearize(self, peek, own):
+        return None
+
+    def _nonlinear(self):
+        """Returns whether the node's `<==` multiplies two signals."""
+        return False
+
+    @property
+    def bounds(self):
+        """The pair of integers `(low, high)` that the value of the signal is
+        known to lie between, or None if it could be anything. Negative values
+        stand for their negations in the field. Bounds come from those declared
+        on inputs, from constants and from constraints, and not from the values
+        that detached computations are expected to have."""
+        if self._bounds is _UNKNOWN:
+            # computed children first, without recursing through deep graphs
+            stack = [self]
+            while stack:
+                node = stack[-1]
+                pending = [
+                    child for child in node.children if child._bounds is _UNKNOWN
+                ]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                if node._bounds is _UNKNOWN:
+                    node._bounds = node._infer_bounds(
+                        *(child._bounds for child in node.children)
+                    )
+        return self._bounds
+
+    @property
+    def bit_width(self):
+        """The number of bits needed to hold the value of the signal, or None if
+        it isn't known to be nonnegative and bounded."""
+        bounds = self.bounds
+        if bounds is None or bounds[0] < 0:
+            return None
+        return max(bounds[1].bit_length(), 1)
+
+    def _infer_bounds(self, *children):
+        return None
+
+    def _restrict(self, low, high):
+        """Narrows the bounds of the signal after constraining it to lie between
+        `low` and `high`."""
+        bounds = self.bounds
+        if bounds is not None:
+            low, high = max(low, bounds[0]), min(high, bounds[1])
+        self._bounds = (low, high)
+
+    def _fingerprint(self):
+        return ()
+
     def detach(self):
-        return Detachment(self)
+        return self.sess.make(Detachment, self)
 
     def check_equals(self, other):
         if isinstance(other, int):
-            other = Constant(self.sess, other)
+            other = self.sess.constant(other)
         assert isinstance(other, Op)
         self.sess.constraints.append((self, other))
+        self.sess.constraint_origins.append(
+            _origin() if self.sess.track_origins else None
+        )
 
 
 class ExternOp(Op):
-    def __init__(self, sess, extern_name, children, assignments, args):
+    def __init__(self, sess, extern, children, assignments, instance_name=None):
         super().__init__(
-            sess=sess, children=children, name=extern_name, passthrough=True,
+            sess=sess, children=children, name=extern.name, passthrough=True,
         )
+        extern_name = extern.name
+        self.extern = extern
         self.extern_name = extern_name
         self.assignments = assignments
-        self.args = args
-        suffix = 0
-        self.component_name = "{}_{}".format(extern_name, suffix)
-        while self.component_name in sess.component_names:
-            suffix += 1
-            self.component_name = "{}_{}".format(extern_name, suffix)
-        sess.component_names.add(self.component_name)
+        self.args = extern.args
+        self.instance_name = instance_name or sess._component_name(extern_name)
+        # (name, index, size) when the component is part of an array
+        self.array = None
+
+    @property
+    def component_name(self):
+        if self.array is None:
+            return self.instance_name
+        name, index, _ = self.array
+        return "{}[{}]".format(name, index)
 
     def _gen_statements(self):
-        component = "component {} = {}({});".format(
-            self.component_name, self.extern_name, ", ".join(str(x) for x in self.args),
+        template = "{}({})".format(
+            self.extern_name, ", ".join(str(x) for x in self.args)
         )
-        statements = [component]
+        if self.array is None:
+            statements = ["component {} = {};".format(self.component_name, template)]
+        else:
+            name, index, size = self.array
+            statements = []
+            if not index:
+                statements.append("component {}[{}];".format(name, size))
+                statements.append(
+                    _loop(size, "{}[i__] = {};".format(name, template))
+                )
         for arg_name, args in self.assignments:
             if isinstance(args, list):
                 for i, arg in enumerate(args):
@@ -241,9 +1909,18 @@ class ExternOp(Op):
                         print(arg)
                     statements.append(
                         "{}.{}[{}] <== {};".format(
-                            self.component_name, arg_name, i, arg.fullname
+                            self.component_name, arg_name, i, self.sess.ref(arg)
                         )
                     )
+            elif isinstance(args, SignalArray):
+                statements.append(
+                    _loop(
+                        arg_name[1],
+                        "{}.{}[i__] <== {};".format(
+                            self.component_name, arg_name[0], args._index_ref("i__")
+                        ),
+                    )
+                )
             elif isinstance(args, ExternArray):
                 statements.append(
                     "for (var i__ = 0; i__ < {size}; i__++) {{\n    {comp}.{arg_name}[i__] <== {extern_component}.{extern_prop}[i__]\n}}".format(
@@ -256,13 +1933,83 @@ class ExternOp(Op):
                 )
             else:
                 statements.append(
-                    "{}.{} <== {};".format(self.component_name, arg_name, args.fullname)
+                    "{}.{} <== {};".format(
+                        self.component_name, arg_name, self.sess.ref(args)
+                    )
                 )
         return statements
 
     def _gen_signals(self):
         return []
 
+    def _compute(self, *columns):
+        if self.extern.evaluator is None:
+            raise Exception(
+                "extern {} has no evaluator to compute its outputs".format(
+                    self.extern_name
+                )
+            )
+        outputs = []
+        for row in zip(*columns):
+            values = iter(row)
+            inputs = {}
+            for arg_name, args in self.assignments:
+                if isinstance(args, list):
+                    inputs[arg_name] = [next(values) for _ in args]
+                elif isinstance(args, (ExternArray, SignalArray)):
+                    inputs[arg_name[0]] = next(values)
+                else:
+                    inputs[arg_name] = next(values)
+            outputs.append(self.extern.evaluator(self.args, inputs))
+        return outputs
+
+    def _compile(self, bind, *args):
+        if self.extern.evaluator is None:
+            raise Exception(
+                "extern {} has no evaluator to compute its outputs".format(
+                    self.extern_name
+                )
+            )
+        args = iter(args)
+        inputs = []
+        for arg_name, values in self.assignments:
+            if isinstance(values, list):
+                value = "[{}]".format(", ".join(next(args) for _ in values))
+            else:
+                value = next(args)
+            if isinstance(values, (ExternArray, SignalArray)):
+                arg_name = arg_name[0]
+            inputs.append("{!r}: {}".format(arg_name, value))
+        return "{}({}, {{{}}})".format(
+            bind(self.extern.evaluator), bind(self.args), ", ".join(inputs)
+        )
+
+    def _fingerprint(self):
+        structure = []
+        for arg_name, args in self.assignments:
+            structure.append((arg_name, len(args) if isinstance(args, list) else None))
+        return (self.extern_name, list(self.args), structure, self.extern.fingerprint())
+
+    def _build(self, cs, *args):
+        if self.extern.builder is None:
+            raise Exception(
+                "extern {} has no builder to add its constraints".format(
+                    self.extern_name
+                )
+            )
+        args = iter(args)
+        inputs = {}
+        for arg_name, values in self.assignments:
+            if isinstance(values, list):
+                inputs[arg_name] = [next(args) for _ in values]
+            elif isinstance(values, (ExternArray, SignalArray)):
+                inputs[arg_name[0]] = next(args)
+            else:
+                inputs[arg_name] = next(args)
+        return self.extern.builder(
+            cs, self.args, inputs, cs.label(self.component_name)
+        )
+
 
 class ExternOutput(Op):
     def __init__(self, extern_op, output_prop):
@@ -285,6 +2032,18 @@ class ExternOutput(Op):
     def _gen_signals(self):
         return []
 
+    def _compute(self, column):
+        return [outputs[self.output_prop] for outputs in column]
+
+    def _compile(self, bind, outputs):
+        return "{}[{!r}]".format(outputs, self.output_prop)
+
+    def _build(self, cs, outputs):
+        return outputs[self.output_prop]
+
+    def _fingerprint(self):
+        return (self.output_prop,)
+
 
 class ExternArray(Op):
     def __init__(self, extern_op, output_prop):
@@ -305,7 +2064,19 @@ class ExternArray(Op):
 
     def __getitem__(self, index):
         assert isinstance(index, int)
-        return ExternArrayElem(self.extern_op, self.output_prop, index)
+        return self.sess.make(ExternArrayElem, self.extern_op, self.output_prop, index)
+
+    def _compute(self, column):
+        return [outputs[self.output_prop] for outputs in column]
+
+    def _compile(self, bind, outputs):
+        return "{}[{!r}]".format(outputs, self.output_prop)
+
+    def _build(self, cs, outputs):
+        return outputs[self.output_prop]
+
+    def _fingerprint(self):
+        return (self.output_prop,)
 
 
 class ExternArrayElem(Op):
@@ -332,61 +2103,64 @@ class ExternArrayElem(Op):
     def _gen_signals(self):
         return []
 
+    def _compute(self, column):
+        return [outputs[self.output_prop][self.index] for outputs in column]
+
+    def _compile(self, bind, outputs):
+        return "{}[{!r}][{}]".format(outputs, self.output_prop, self.index)
+
+    def _build(self, cs, outputs):
+        return outputs[self.output_prop][self.index]
+
+    def _fingerprint(self):
+        return (self.output_prop, self.index)
+
 
 class Var(Op):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def __add__(self, other):
-        if isinstance(other, int):
-            return VarAdd(self, Constant(self.sess, other))
-        assert isinstance(other, Op)
-        return VarAdd(self, other)
+        return self.sess.make(VarAdd, self, self._operand(other))
 
     def __sub__(self, other):
-        if isinstance(other, int):
-            return VarSub(self, Constant(self.sess, other))
-        assert isinstance(other, Op)
-        return VarSub(self, other)
+        return self.sess.make(VarSub, self, self._operand(other))
 
     def __mul__(self, other):
-        if isinstance(other, int):
-            return VarMul(self, Constant(self.sess, other))
-        assert isinstance(other, Op)
-        return VarMul(self, other)
+        return self.sess.make(VarMul, self, self._operand(other))
 
     def __truediv__(self, other):
-        if isinstance(other, int):
-            return VarDiv(self, Constant(self.sess, other))
-        assert isinstance(other, Op)
-        return VarDiv(self, other)
+        return self.sess.make(VarDiv, self, self._operand(other))
 
     def __mod__(self, other):
-        if isinstance(other, int):
-            return VarMod(self, Constant(self.sess, other))
-        assert isinstance(other, Op)
-        return VarMod(self, other)
+        return self.sess.make(VarMod, self, self._operand(other))
 
     def __eq__(self, other):
-        if isinstance(other, int):
-            other = self.sess.constant(other)
-        assert isinstance(other, Op)
-        return VarEq(self, other)
+        return self.sess.make(VarEq, self, self._operand(other))
 
     def __ne__(self, other):
-        if isinstance(other, int):
-            other = self.sess.constant(other)
-        assert isinstance(other, Op)
-        return VarNeq(self, other)
+        return self.sess.make(VarNeq, self, self._operand(other))
 
     def __and__(self, other):
+        return self.sess.make(VarAnd, self, self._operand(other))
+
+    def _operand(self, other):
         if isinstance(other, int):
-            other = self.sess.constant(other)
+            return self.sess.constant(other)
         assert isinstance(other, Op)
-        return VarAnd(self, other)
+        if isinstance(other, SignalArray):
+            raise _detached_array_error(other, self)
+        return other
 
     def attach(self):
-        return Attachment(self)
+        return self.sess.make(Attachment, self)
+
+    def _build(self, cs, *args):
+        # a hint: the wire is assigned a value but not constrained
+        value = None
+        if cs.values is not None:
+            [value] = self._compute(*([cs.value(arg)] for arg in args))
+        return {cs.wire(cs.label(self.fullname), value): 1}
 
 
 class Constant(Op):
@@ -403,6 +2177,53 @@ class Constant(Op):
     def _gen_signals(self):
         return []
 
+    def _linearize(self, peek, own):
+        return LinearCombination(constant=self.val)
+
+    def _compute_leaf(self, inputs, size):
+        return [self.val % P] * size
+
+    def _compile(self, bind):
+        return str(self.val % P)
+
+    def _infer_bounds(self):
+        return _interval(self.val, self.val)
+
+    def _build(self, cs):
+        return {0: self.val % P}
+
+    def _fingerprint(self):
+        return (self.val,)
+
+
+class TemplateParam(Constant):
+    """A constant that is a parameter of the `Main` template."""
+    def __init__(self, sess, name, default):
+        super().__init__(sess, default)
+        self.name = name
+        sess.names.add(name)
+
+    @property
+    def fullname(self):
+        return self.name
+
+    def _linearize(self, peek, own):
+        return LinearCombination.of(self)
+
+    def _infer_bounds(self):
+        return None
+
+    def _compute_leaf(self, inputs, size):
+        if self.name not in inputs:
+            return super()._compute_leaf(inputs, size)
+        return Input._compute_leaf(self, inputs, size)
+
+    def _compile(self, bind):
+        return "inputs.get({!r}, {}) % P".format(self.name, self.val % P)
+
+    def _fingerprint(self):
+        return (self.name, self.val)
+
 
 class Detachment(Var):
     def __init__(self, signal):
@@ -415,9 +2236,12 @@ class Detachment(Var):
         [signal] = self.children
         return signal.fullname
 
-    def _gen(self, *args, **kwargs):
+    def _gen_node(self):
         [signal] = self.children
-        return signal._gen(*args, **kwargs)
+        return signal._gen_node()
+
+    def _infer_bounds(self, signal):
+        return signal
 
 
 class Attachment(Op):
@@ -429,9 +2253,9 @@ class Attachment(Op):
         [var] = self.children
         return var.fullname
 
-    def _gen(self, *args, **kwargs):
+    def _gen_node(self):
         [var] = self.children
-        return var._gen(*args, **kwargs)
+        return var._gen_node()
 
 
 class VarAdd(Var):
@@ -440,16 +2264,25 @@ class VarAdd(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_plus_{}".format(left.name, right.name),
+            name=left.sess.op_name("plus", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} + {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [(a + b) % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "({} + {}) % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _add_bounds(left, right)
+
 
 class VarSub(Var):
     def __init__(self, left, right):
@@ -457,16 +2290,25 @@ class VarSub(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_minus_{}".format(left.name, right.name),
+            name=left.sess.op_name("minus", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} - {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [(a - b) % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "({} - {}) % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _add_bounds(left, right, -1)
+
 
 class VarMul(Var):
     def __init__(self, left, right):
@@ -474,16 +2316,25 @@ class VarMul(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_times_{}".format(left.name, right.name),
+            name=left.sess.op_name("times", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} * {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [a * b % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "{} * {} % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _mul_bounds(left, right)
+
 
 class VarEq(Var):
     def __init__(self, left, right):
@@ -491,16 +2342,25 @@ class VarEq(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_eq_{}".format(left.name, right.name),
+            name=left.sess.op_name("eq", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} == {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [int(a == b) for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "int({} == {})".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return (0, 1)
+
 
 class VarNeq(Var):
     def __init__(self, left, right):
@@ -508,16 +2368,25 @@ class VarNeq(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_neq_{}".format(left.name, right.name),
+            name=left.sess.op_name("neq", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} != {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [int(a != b) for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "int({} != {})".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return (0, 1)
+
 
 class VarAnd(Var):
     def __init__(self, left, right):
@@ -525,16 +2394,25 @@ class VarAnd(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_and_{}".format(left.name, right.name),
+            name=left.sess.op_name("and", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} && {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [int(bool(a) and bool(b)) for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "int(bool({}) and bool({}))".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return (0, 1)
+
 
 class VarCond(Var):
     def __init__(self, pred, left, right):
@@ -542,16 +2420,31 @@ class VarCond(Var):
         super().__init__(
             sess=left.sess,
             children=[pred, left, right],
-            name="if_{}".format(pred.name),
+            name=left.sess.op_name("if", pred),
         )
 
     def _gen_statements(self):
         [pred, left, right] = self.children
         statement = "if ({} == 1) {{ {} <-- {}; }} else {{ {} <-- {}; }}".format(
-            pred.fullname, self.fullname, left.fullname, self.fullname, right.fullname
+            self.sess.ref(pred),
+            self.fullname,
+            self.sess.ref(left),
+            self.fullname,
+            self.sess.ref(right),
         )
         return [statement]
 
+    def _compute(self, pred, left, right):
+        return [a if c == 1 else b for c, a, b in zip(pred, left, right)]
+
+    def _compile(self, bind, *args):
+        return "({1} if {0} == 1 else {2})".format(*args)
+
+    def _infer_bounds(self, pred, left, right):
+        if left is None or right is None:
+            return None
+        return (min(left[0], right[0]), max(left[1], right[1]))
+
 
 class VarDiv(Var):
     def __init__(self, left, right):
@@ -559,16 +2452,22 @@ class VarDiv(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_div_{}".format(left.name, right.name),
+            name=left.sess.op_name("div", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} / {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [a * b % P for a, b in zip(left, batch_inverse(right))]
+
+    def _compile(self, bind, *args):
+        return "{} * inverse({}) % P".format(*args)
+
 
 class VarMod(Var):
     def __init__(self, left, right):
@@ -576,16 +2475,76 @@ class VarMod(Var):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_mod_{}".format(left.name, right.name),
+            name=left.sess.op_name("mod", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <-- {} % {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _compute(self, left, right):
+        return [a % b for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "{} % {}".format(*args)
+
+    def _infer_bounds(self, left, right):
+        if right is None or right[0] < 1:
+            return None
+        if left is not None and left[0] >= 0:
+            return (0, min(left[1], right[1] - 1))
+        return (0, right[1] - 1)
+
+
+class VarInv(Var):
+    def __init__(self, value):
+        super().__init__(
+            sess=value.sess, children=[value], name=value.sess.op_name("inv", value)
+        )
+
+    def _gen_statements(self):
+        [value] = self.children
+        ref = self.sess.ref(value)
+        statement = "{} <-- {} != 0 ? 1 / {} : 0;".format(self.fullname, ref, ref)
+        return [statement]
+
+    def _compute(self, value):
+        # zeros invert to 0, and the other values are inverted together
+        inverses = iter(batch_inverse([a for a in value if a]))
+        return [next(inverses) if a else 0 for a in value]
+
+    def _compile(self, bind, value):
+        return "(inverse({0}) if {0} else 0)".format(value)
+
+
+class VarBit(Var):
+    def __init__(self, value, bit):
+        assert value.sess is bit.sess
+        super().__init__(
+            sess=value.sess,
+            children=[value, bit],
+            name=value.sess.op_name("bit", value, bit),
+        )
+
+    def _gen_statements(self):
+        [value, bit] = self.children
+        statement = "{} <-- ({} >> {}) & 1;".format(
+            self.fullname, self.sess.ref(value), self.sess.ref(bit)
+        )
+        return [statement]
+
+    def _compute(self, value, bit):
+        return [(a >> b) & 1 for a, b in zip(value, bit)]
+
+    def _compile(self, bind, *args):
+        return "({} >> {}) & 1".format(*args)
+
+    def _infer_bounds(self, value, bit):
+        return (0, 1)
+
 
 class Add(Op):
     def __init__(self, left, right):
@@ -593,16 +2552,32 @@ class Add(Op):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_plus_{}".format(left.name, right.name),
+            name=left.sess.op_name("plus", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <== {} + {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        return own(left).add(peek(right))
+
+    def _build(self, cs, left, right):
+        return lc_add(left, right)
+
+    def _compute(self, left, right):
+        return [(a + b) % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "({} + {}) % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _add_bounds(left, right)
+
 
 class Sub(Op):
     def __init__(self, left, right):
@@ -610,16 +2585,32 @@ class Sub(Op):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_minus_{}".format(left.name, right.name),
+            name=left.sess.op_name("minus", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <== {} - {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        return own(left).add(peek(right), -1)
+
+    def _build(self, cs, left, right):
+        return lc_add(left, right, -1)
+
+    def _compute(self, left, right):
+        return [(a - b) % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "({} - {}) % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _add_bounds(left, right, -1)
+
 
 class Mul(Op):
     def __init__(self, left, right):
@@ -627,16 +2618,80 @@ class Mul(Op):
         super().__init__(
             sess=left.sess,
             children=[left, right],
-            name="{}_times_{}".format(left.name, right.name),
+            name=left.sess.op_name("times", left, right),
         )
 
     def _gen_statements(self):
         [left, right] = self.children
         statement = "{} <== {} * {};".format(
-            self.fullname, left.fullname, right.fullname
+            self.fullname, self.sess.ref(left), self.sess.ref(right)
         )
         return [statement]
 
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        # multiplying by numbers and params keeps the combination linear
+        if not peek(left).has_signals():
+            return own(right).multiply(peek(left))
+        if not peek(right).has_signals():
+            return own(left).multiply(peek(right))
+        return None
+
+    def _compute(self, left, right):
+        return [a * b % P for a, b in zip(left, right)]
+
+    def _compile(self, bind, *args):
+        return "{} * {} % P".format(*args)
+
+    def _infer_bounds(self, left, right):
+        return _mul_bounds(left, right)
+
+    def _build(self, cs, left, right):
+        return cs.mul(left, right, cs.label(self.fullname))
+
+    def _nonlinear(self):
+        return not any(isinstance(child, Constant) for child in self.children)
+
+
+class Sum(Op):
+    def __init__(self, sess, *terms):
+        assert all(term.sess is sess for term in terms)
+        super().__init__(
+            sess=sess, children=list(terms), name=sess.op_name("sum", terms[0])
+        )
+
+    def _gen_statements(self):
+        terms = " + ".join(self.sess.ref(term) for term in self.children)
+        statement = "{} <== {};".format(self.fullname, terms)
+        return [statement]
+
+    def _linearize(self, peek, own):
+        [first, *rest] = self.children
+        combination = own(first)
+        for term in rest:
+            combination.add(peek(term))
+        return combination
+
+    def _build(self, cs, *terms):
+        total = {}
+        for term in terms:
+            for wire, coeff in term.items():
+                total[wire] = total.get(wire, 0) + coeff
+        return {wire: coeff % P for wire, coeff in total.items() if coeff % P}
+
+    def _compute(self, *columns):
+        return [sum(values) % P for values in zip(*columns)]
+
+    def _compile(self, bind, *args):
+        # a tuple rather than a chain of +, which Python compiles recursively
+        return "sum(({},)) % P".format(", ".join(args))
+
+    def _infer_bounds(self, *terms):
+        bounds = (0, 0)
+        for term in terms:
+            bounds = _add_bounds(bounds, term)
+        return bounds
+
 
 class IdentityOp(Op):
     def __init__(self, signal):
@@ -644,15 +2699,39 @@ class IdentityOp(Op):
 
     def _gen_statements(self):
         [signal] = self.children
-        statement = "{} <== {};".format(self.fullname, signal.fullname)
+        statement = "{} <== {};".format(self.fullname, self.sess.ref(signal))
         return [statement]
 
+    def _linearize(self, peek, own):
+        [signal] = self.children
+        return own(signal)
+
+    def _compute(self, signal):
+        return signal
+
+    def _compile(self, bind, signal):
+        return signal
+
+    def _infer_bounds(self, signal):
+        return signal
+
+    def _build(self, cs, signal):
+        return signal
+
 
 class Input(Op):
     def __init__(self, sess, name, private=False):
         super().__init__(sess=sess, name=name, children=[])
         self.private = private
 
+    def _compute_leaf(self, inputs, size):
+        if self.name not in inputs:
+            raise Exception("no value given for input {}".format(self.name))
+        column = [value % P for value in inputs[self.name]]
+        if len(column) != size:
+            raise Exception("expected {} values for input {}".format(size, self.name))
+        return column
+
     def _gen_signals(self):
         signal = "signal "
         if self.private:
@@ -663,3 +2742,486 @@ class Input(Op):
     @property
     def fullname(self):
         return self.name
+
+    def _compile(self, bind):
+        return "inputs[{!r}] % P".format(self.name)
+
+    def _build_leaf(self, cs, value):
+        return {cs.wire(cs.label(self.fullname), value): 1}
+
+    def _fingerprint(self):
+        return (self.name, self.private)
+
+
+class ParamInput(Input):
+    """A param that is a public input of the circuit, with a default value for
+    computing witnesses."""
+    def __init__(self, sess, name, default):
+        super().__init__(sess, name)
+        self.default = default
+
+    def _compute_leaf(self, inputs, size):
+        if self.name not in inputs:
+            return [self.default % P] * size
+        return super()._compute_leaf(inputs, size)
+
+    def _compile(self, bind):
+        return "inputs.get({!r}, {}) % P".format(self.name, self.default % P)
+
+
+def _detached_array_error(array, var):
+    return Exception(
+        "can't combine the array {} with the detached {}: arrays can't be "
+        "detached, so attach it first".format(array.fullname, var.fullname)
+    )
+
+
+def _loop(length, statement):
+    return "for (var i__ = 0; i__ < {}; i__++) {{\n    {}\n}}".format(length, statement)
+
+
+class SignalArray:
+    """Mixin for nodes holding an array of `length` signals."""
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return (self[i] for i in range(self.length))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            assert step == 1 and start < stop
+            return self.sess.make(ArraySlice, self, start, stop)
+        assert isinstance(index, int)
+        if index < 0:
+            index += self.length
+        assert 0 <= index < self.length
+        return self._element(index)
+
+    def __add__(self, other):
+        return self._elementwise(ArrayAdd, other)
+
+    def __sub__(self, other):
+        return self._elementwise(ArraySub, other)
+
+    def __mul__(self, other):
+        return self._elementwise(ArrayMul, other)
+
+    def _elementwise(self, cls, other):
+        if isinstance(other, int):
+            other = self.sess.constant(other)
+        assert isinstance(other, Op)
+        if isinstance(other, Var):
+            raise _detached_array_error(self, other)
+        return self.sess.make(cls, self, other)
+
+    def detach(self):
+        raise Exception("arrays can't be detached; detach their elements instead")
+
+    def _element(self, index):
+        return self.sess.make(ArrayElem, self, index)
+
+    def _index_ref(self, index):
+        """Returns the expression that refers to the element at the expression
+        `index` in the statements being generated."""
+        return "{}[{}]".format(self.fullname, index)
+
+
+class InputArray(SignalArray, Input):
+    def __init__(self, sess, name, length, private=False):
+        self.length = length
+        super().__init__(sess, name, private)
+
+    def _compute_leaf(self, inputs, size):
+        if self.name not in inputs:
+            raise Exception("no value given for input {}".format(self.name))
+        column = []
+        for value in inputs[self.name]:
+            if len(value) != self.length:
+                raise Exception(
+                    "expected {} elements for input {}".format(self.length, self.name)
+                )
+            column.append([element % P for element in value])
+        if len(column) != size:
+            raise Exception("expected {} values for input {}".format(size, self.name))
+        return column
+
+    def _gen_signals(self):
+        signal = "signal "
+        if self.private:
+            signal += "private "
+        signal += "input {}[{}];".format(self.fullname, self.length)
+        return [signal]
+
+    def _compile(self, bind):
+        return "[value % P for value in inputs[{!r}]]".format(self.name)
+
+    def _build_leaf(self, cs, value):
+        return [
+            {cs.wire(cs.label("{}[{}]".format(self.fullname, i)), element): 1}
+            for i, element in enumerate(value or [None] * self.length)
+        ]
+
+    def _fingerprint(self):
+        return (self.name, self.private, self.length)
+
+
+class ArraySlice(SignalArray, Op):
+    def __init__(self, array, start, stop):
+        super().__init__(
+            sess=array.sess, children=[array], name=array.name, passthrough=True
+        )
+        self.array = array
+        self.start = start
+        self.stop = stop
+        self.length = stop - start
+
+    @property
+    def fullname(self):
+        return "{}[{}:{}]".format(self.array.fullname, self.start, self.stop)
+
+    def _gen_signals(self):
+        return []
+
+    def _element(self, index):
+        return self.array._element(self.start + index)
+
+    def _linearize(self, peek, own):
+        return peek(self.array).map_arrays(
+            lambda array: array[self.start : self.stop]
+        )
+
+    def _index_ref(self, index):
+        if not self.start:
+            return self.array._index_ref(index)
+        return self.array._index_ref("{} + {}".format(index, self.start))
+
+    def _compute(self, column):
+        return [value[self.start : self.stop] for value in column]
+
+    def _compile(self, bind, array):
+        return "{}[{}:{}]".format(array, self.start, self.stop)
+
+    def _build(self, cs, array):
+        return array[self.start : self.stop]
+
+    def _fingerprint(self):
+        return (self.start, self.stop)
+
+
+class ArrayElem(Op):
+    def __init__(self, array, index):
+        super().__init__(
+            sess=array.sess, children=[array], name=array.name, passthrough=True
+        )
+        self.array = array
+        self.index = index
+
+    @property
+    def fullname(self):
+        return self.array._index_ref(self.index)
+
+    def _gen_signals(self):
+        return []
+
+    def _linearize(self, peek, own):
+        return peek(self.array).map_arrays(lambda array: array._element(self.index))
+
+    def _compute(self, column):
+        return [value[self.index] for value in column]
+
+    def _compile(self, bind, array):
+        return "{}[{}]".format(array, self.index)
+
+    def _build(self, cs, array):
+        return array[self.index]
+
+    def _fingerprint(self):
+        return (self.index,)
+
+
+class ArrayOp(SignalArray, Op):
+    """An element-wise operation on arrays, or on an array and a single signal,
+    which is used for every element."""
+    def __init__(self, left, right):
+        assert left.sess is right.sess
+        lengths = {
+            child.length for child in (left, right) if isinstance(child, SignalArray)
+        }
+        assert len(lengths) == 1
+        super().__init__(
+            sess=left.sess,
+            children=[left, right],
+            name=left.sess.op_name(self.op, left, right),
+        )
+        [self.length] = lengths
+
+    def _gen_signals(self):
+        return ["signal {}[{}];".format(self.fullname, self.length)]
+
+    def _gen_statements(self):
+        left, right = (self._operand(child, "i__") for child in self.children)
+        statement = "{} <== {} {} {};".format(
+            self._index_ref("i__"), left, self.symbol, right
+        )
+        return [_loop(self.length, statement)]
+
+    def _operand(self, child, index):
+        if isinstance(child, SignalArray):
+            return child._index_ref(index)
+        return self.sess.ref(child)
+
+    def _index_ref(self, index):
+        combination = self.sess._linear.get(id(self))
+        if combination is not None:
+            return combination.render(True, index)
+        return super()._index_ref(index)
+
+    def _elements(self, *values):
+        """Pairs up the elements of the operands' values, repeating single
+        values."""
+        return zip(
+            *(
+                value if isinstance(child, SignalArray) else [value] * self.length
+                for child, value in zip(self.children, values)
+            )
+        )
+
+    def _compute(self, left, right):
+        return [
+            [self.apply(a, b) for a, b in self._elements(*values)]
+            for values in zip(left, right)
+        ]
+
+    def _compile(self, bind, *args):
+        operands = [
+            arg
+            if isinstance(child, SignalArray)
+            else "[{}] * {}".format(arg, self.length)
+            for child, arg in zip(self.children, args)
+        ]
+        return "[{} for a, b in zip({}, {})]".format(self.formula, *operands)
+
+    def _build(self, cs, left, right):
+        return [
+            self._build_element(cs, i, a, b)
+            for i, (a, b) in enumerate(self._elements(left, right))
+        ]
+
+
+class ArrayAdd(ArrayOp):
+    op = "plus"
+    symbol = "+"
+    formula = "(a + b) % P"
+
+    @staticmethod
+    def apply(a, b):
+        return (a + b) % P
+
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        return own(left).add(peek(right))
+
+    def _build_element(self, cs, i, a, b):
+        return lc_add(a, b)
+
+
+class ArraySub(ArrayOp):
+    op = "minus"
+    symbol = "-"
+    formula = "(a - b) % P"
+
+    @staticmethod
+    def apply(a, b):
+        return (a - b) % P
+
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        return own(left).add(peek(right), -1)
+
+    def _build_element(self, cs, i, a, b):
+        return lc_add(a, b, -1)
+
+
+class ArrayMul(ArrayOp):
+    op = "times"
+    symbol = "*"
+    formula = "a * b % P"
+
+    @staticmethod
+    def apply(a, b):
+        return a * b % P
+
+    def _linearize(self, peek, own):
+        [left, right] = self.children
+        if not peek(left).has_signals():
+            return own(right).multiply(peek(left))
+        if not peek(right).has_signals():
+            return own(left).multiply(peek(right))
+        return None
+
+    def _build_element(self, cs, i, a, b):
+        return cs.mul(a, b, cs.label("{}[{}]".format(self.fullname, i)))
+
+    def _nonlinear(self):
+        return not any(isinstance(child, Constant) for child in self.children)
+
+
+class TemplateInput(Input):
+    """An input of a template being traced, referred to as `fullname`, which
+    is an element of an array for array inputs."""
+    def __init__(self, sess, name, fullname):
+        self.input_fullname = fullname
+        super().__init__(sess, name)
+
+    @property
+    def fullname(self):
+        return self.input_fullname
+
+    def _gen_signals(self):
+        # declared by the template
+        return []
+
+
+class TemplateOutputs(Op):
+    """Assigns the outputs of a template being traced to its `out` signal."""
+    def __init__(self, sess, outputs, array):
+        super().__init__(sess=sess, children=outputs, name="out", passthrough=True)
+        self.array = array
+
+    @property
+    def fullname(self):
+        return "out"
+
+    def _gen_signals(self):
+        return []
+
+    def _gen_statements(self):
+        if not self.array:
+            return [
+                "out <== {};".format(self.sess.ref(output)) for output in self.children
+            ]
+        return [
+            "out[{}] <== {};".format(i, self.sess.ref(output))
+            for i, output in enumerate(self.children)
+        ]
+
+    def _compute(self, *columns):
+        return [list(row) for row in zip(*columns)]
+
+    def _build(self, cs, *outputs):
+        return list(outputs)
+
+
+class LinearCombination:
+    """A sum of terms scaled by constant coefficients, plus a constant term. A
+    term is the product of its factors: a signal, params, or a signal and
+    params, which is still linear in the signals since params are known when
+    the circuit is compiled. Terms are keyed by the `id`s of their factors.
+
+    The combination of an array is computed element by element: a factor that
+    is an array stands for its element at the index being computed, and the
+    other terms are the same for every element."""
+    def __init__(self, terms=None, constant=0):
+        self.terms = {} if terms is None else terms
+        self.constant = constant
+
+    @classmethod
+    def of(cls, node):
+        return cls({(id(node),): ((node,), 1)})
+
+    def copy(self):
+        return LinearCombination(dict(self.terms), self.constant)
+
+    def add(self, other, scale=1):
+        for key, (factors, coeff) in other.terms.items():
+            self._add_term(key, factors, coeff * scale)
+        self.constant += other.constant * scale
+        return self
+
+    def _add_term(self, key, factors, coeff):
+        terms = self.terms
+        if key in terms:
+            coeff += terms[key][1]
+        if coeff:
+            terms[key] = (factors, coeff)
+        else:
+            terms.pop(key, None)
+
+    def has_signals(self):
+        return any(
+            not isinstance(factor, TemplateParam)
+            for factors, _ in self.terms.values()
+            for factor in factors
+        )
+
+    def map_arrays(self, replace):
+        """Returns the combination with every factor that is an array replaced by
+        `replace(array)`."""
+        combination = LinearCombination(constant=self.constant)
+        for factors, coeff in self.terms.values():
+            factors = tuple(
+                replace(node) if isinstance(node, SignalArray) else node
+                for node in factors
+            )
+            key = tuple(id(node) for node in factors)
+            combination._add_term(key, factors, coeff)
+        return combination
+
+    def multiply(self, factor):
+        """Multiplies the combination by `factor`, which mustn't have signals, so
+        that the product is still linear."""
+        if not factor.terms:
+            return self.scale(factor.constant)
+        product = self.copy().scale(factor.constant)
+        for params, coeff in factor.terms.values():
+            terms = list(self.terms.values())
+            if self.constant:
+                terms.append(((), self.constant))
+            for factors, own_coeff in terms:
+                # params first, by name, then the signal
+                factors = tuple(
+                    sorted(
+                        factors + params,
+                        key=lambda node: (
+                            not isinstance(node, TemplateParam), node.fullname
+                        ),
+                    )
+                )
+                key = tuple(id(node) for node in factors)
+                product._add_term(key, factors, own_coeff * coeff)
+        return product
+
+    def scale(self, factor):
+        if not factor:
+            self.terms.clear()
+        else:
+            for key, (factors, coeff) in self.terms.items():
+                self.terms[key] = (factors, coeff * factor)
+        self.constant *= factor
+        return self
+
+    def render(self, parenthesize=False, index=None):
+        """Returns the expression computing the combination, or with `index`,
+        the expression computing the element at `index` of an array's."""
+        parts = []
+        for factors, coeff in self.terms.values():
+            name = "*".join(
+                node._index_ref(index)
+                if index is not None and isinstance(node, SignalArray)
+                else node.fullname
+                for node in factors
+            )
+            if coeff == 1:
+                parts.append(name)
+            elif coeff == -1:
+                parts.append("-{}".format(name))
+            else:
+                parts.append("{}*{}".format(coeff, name))
+        if self.constant or not parts:
+            parts.append(str(self.constant))
+        text = " + ".join(parts).replace(" + -", " - ")
+        if parenthesize and (len(parts) > 1 or text.startswith("-") or "*" in text):
+            return "({})".format(text)
+        return text
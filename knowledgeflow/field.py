@@ -0,0 +1,27 @@
+"""Arithmetic over the BN254 scalar field, which Circom circuits compute in."""
+
+P = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+
+
+def inverse(x):
+    if x % P == 0:
+        raise ZeroDivisionError("division by zero in the field")
+    return pow(x, -1, P)
+
+
+def batch_inverse(values):
+    """Inverts every value in `values` with a single field inversion, using
+    Montgomery's trick: 3(n - 1) multiplications replace n - 1 inversions."""
+    prefixes = []
+    product = 1
+    for value in values:
+        if value % P == 0:
+            raise ZeroDivisionError("division by zero in the field")
+        prefixes.append(product)
+        product = product * value % P
+    inv = pow(product, -1, P)
+    inverses = [0] * len(prefixes)
+    for i in range(len(prefixes) - 1, -1, -1):
+        inverses[i] = inv * prefixes[i] % P
+        inv = inv * values[i] % P
+    return inverses
@@ -0,0 +1,189 @@
+"""Arithmetic gadgets built from KnowledgeFlow operations, each constrained with
+as few constraints as the bounds of its inputs allow.
+
+Gadgets that compare signals or split them into bits need to know how large
+their inputs can be, which they read from `Op.bounds`. Declare bounds on your
+inputs, or check them with `Session.bits`, before using those gadgets on them.
+Every gadget accepts numbers in place of signals, as long as at least one of its
+arguments is a signal, and the bounds of its outputs are known, so gadgets can be
+chained.
+"""
+
+from .dsl import Op, VarInv, _interval, _mul_bounds
+from .field import P
+
+# the widest comparison whose bits can't wrap around the field
+MAX_BITS = P.bit_length() - 2
+
+
+def _signals(sess, *values):
+    return [
+        sess.constant(value) if isinstance(value, int) else value for value in values
+    ]
+
+
+def _session(*values):
+    for value in values:
+        if isinstance(value, Op):
+            return value.sess
+    raise Exception("expected at least one signal")
+
+
+def _bounds(x):
+    bounds = x.bounds
+    if bounds is None:
+        raise Exception(
+            "the bounds of {} aren't known: declare bounds on the inputs it's "
+            "computed from, or check them with sess.bits".format(x.fullname)
+        )
+    return bounds
+
+
+def is_zero(x):
+    """Returns 1 if `x` is zero, and 0 otherwise, with two constraints."""
+    sess = _session(x)
+    bounds = x.bounds
+    if bounds == (0, 0):
+        return sess.constant(1)
+    if bounds is not None and (bounds[0] > 0 or bounds[1] < 0):
+        return sess.constant(0)
+    inv = sess.make(VarInv, x.detach()).attach()
+    out = sess.constant(1) - x * inv
+    (x * out).check_equals(0)
+    out._restrict(0, 1)
+    return out
+
+
+def is_equal(a, b):
+    """Returns 1 if `a` equals `b`, and 0 otherwise."""
+    a, b = _signals(_session(a, b), a, b)
+    return is_zero(a - b)
+
+
+def mux(pred, then, otherwise):
+    """Returns `then` if `pred` is 1 and `otherwise` if it's 0, with a single
+    constraint, and checks that `pred` is one or the other unless its bounds
+    already say so. Unlike `Session.cond`, the result is constrained."""
+    sess = _session(pred, then, otherwise)
+    pred, then, otherwise = _signals(sess, pred, then, otherwise)
+    bounds = pred.bounds
+    if bounds is None or bounds[0] < 0 or bounds[1] > 1:
+        (pred * (pred - 1)).check_equals(0)
+        pred._restrict(0, 1)
+    out = otherwise + pred * (then - otherwise)
+    bounds = [then.bounds, otherwise.bounds]
+    if None not in bounds:
+        out._restrict(min(low for low, _ in bounds), max(high for _, high in bounds))
+    return out
+
+
+def less_than(a, b):
+    """Returns 1 if `a < b`, and 0 otherwise, comparing the signals as integers
+    (negative values included) with one bit more than the range of their
+    bounds takes."""
+    sess = _session(a, b)
+    a, b = _signals(sess, a, b)
+    a_bounds, b_bounds = _bounds(a), _bounds(b)
+    if a_bounds[1] < b_bounds[0]:
+        return sess.constant(1)
+    if a_bounds[0] >= b_bounds[1]:
+        return sess.constant(0)
+    low, high = min(a_bounds[0], b_bounds[0]), max(a_bounds[1], b_bounds[1])
+    width = (high - low).bit_length()
+    if width > MAX_BITS:
+        raise Exception("can't compare signals wider than {} bits".format(MAX_BITS))
+    # a - b + 2**width lies in [1, 2**(width + 1)), and its top bit is set
+    # exactly when a >= b
+    bits = sess.bits(a - b + (1 << width), width + 1)
+    return sess.constant(1) - bits[width]
+
+
+def is_negative(x):
+    """Returns 1 if `x` is negative, and 0 otherwise."""
+    sess = _session(x)
+    low, high = _bounds(x)
+    if low >= 0:
+        return sess.constant(0)
+    if high < 0:
+        return sess.constant(1)
+    return less_than(x, 0)
+
+
+def abs(x):
+    """Returns the absolute value of `x`, with one constraint more than
+    `is_negative`."""
+    _session(x)
+    low, high = _bounds(x)
+    out = x - is_negative(x) * x * 2
+    if low >= 0:
+        out._restrict(low, high)
+    elif high <= 0:
+        out._restrict(-high, -low)
+    else:
+        out._restrict(0, max(-low, high))
+    return out
+
+
+def floor_div(dividend, divisor):
+    """Returns the quotient of `dividend` by `divisor`, rounded down, which
+    checks that `divisor` is positive."""
+    quotient, _ = div_mod(dividend, divisor)
+    return quotient
+
+
+def modulo(dividend, divisor):
+    """Returns the remainder of `dividend` by `divisor`, which is between 0 and
+    `divisor - 1` even when `dividend` is negative, and checks that `divisor` is
+    positive."""
+    _, remainder = div_mod(dividend, divisor)
+    return remainder
+
+
+def div_mod(dividend, divisor):
+    """Returns the quotient and remainder of `dividend` by `divisor`, as
+    `floor_div` and `modulo` do. Both are computed by the prover, and checked
+    with a multiplication and bit decompositions of the remainder and quotient
+    sized by the bounds of the operands. Repeated calls share their checks."""
+    sess = _session(dividend, divisor)
+    dividend, divisor = _signals(sess, dividend, divisor)
+    return sess.intern(
+        ("div_mod", id(dividend), id(divisor)),
+        lambda: _div_mod(sess, dividend, divisor),
+    )
+
+
+def _div_mod(sess, dividend, divisor):
+    low, high = _bounds(dividend)
+    divisor_low, divisor_high = _bounds(divisor)
+    if divisor_high < 1:
+        raise Exception("the divisor {} can't be positive".format(divisor.fullname))
+    divisor_low = max(divisor_low, 1)
+    quotient_low = low // (divisor_low if low < 0 else divisor_high)
+    quotient_high = high // (divisor_low if high >= 0 else divisor_high)
+    # the bits checking the quotient allow it up to the next power of two, so
+    # the product mustn't wrap around for any of those values either
+    quotient_width = (quotient_high - quotient_low).bit_length()
+    quotient_max = quotient_low + (1 << quotient_width) - 1
+    product = _mul_bounds((quotient_low, quotient_max), (0, divisor_high))
+    if product is None or _interval(product[0], product[1] + divisor_high) is None:
+        raise Exception("the operands of the division are too large")
+
+    # shift negative dividends by a multiple of the divisor, so that the
+    # prover's % works on nonnegative numbers
+    shifted = dividend.detach()
+    if low < 0:
+        shifted = shifted + divisor.detach() * -low
+    remainder_hint = shifted % divisor.detach()
+    remainder = remainder_hint.attach()
+    quotient = ((dividend.detach() - remainder_hint) / divisor.detach()).attach()
+
+    (divisor * quotient).check_equals(dividend - remainder)
+    width = (divisor_high - 1).bit_length()
+    sess.bits(remainder, width)
+    if divisor.bounds != (1 << width, 1 << width):
+        sess.bits(divisor - remainder - 1, width)
+    offset = quotient - quotient_low if quotient_low else quotient
+    sess.bits(offset, quotient_width)
+    quotient._restrict(quotient_low, quotient_high)
+    remainder._restrict(0, divisor_high - 1)
+    return quotient, remainder
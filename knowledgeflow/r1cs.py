@@ -0,0 +1,155 @@
+"""Rank-1 constraint systems, and writers for the iden3 `.r1cs`, `.sym` and
+`.wtns` files that snarkjs reads.
+
+Linear combinations are dictionaries mapping wire indices to coefficients in the
+field. Wire 0 always holds the constant 1, so `{0: 5}` is the constant 5.
+"""
+
+import struct
+
+from .field import P
+
+FIELD_BYTES = 32
+
+
+def lc_add(left, right, scale=1):
+    """Returns `left + scale * right`."""
+    result = dict(left)
+    for wire, coeff in right.items():
+        coeff = (result.get(wire, 0) + coeff * scale) % P
+        if coeff:
+            result[wire] = coeff
+        else:
+            result.pop(wire, None)
+    return result
+
+
+def lc_scale(lc, factor):
+    factor %= P
+    if not factor:
+        return {}
+    return {wire: coeff * factor % P for wire, coeff in lc.items()}
+
+
+def lc_constant(lc):
+    """Returns the value of `lc` if it doesn't depend on any wire but the constant
+    one, and None otherwise."""
+    if any(wire != 0 for wire in lc):
+        return None
+    return lc.get(0, 0)
+
+
+class ConstraintSystem:
+    """A list of constraints `A * B = C` over numbered wires. If `witness` is
+    true, the value of every wire is computed as it is added. If `constraints`
+    is false, only the wires are kept. Wires are labelled relative to the
+    component being built, `scope`."""
+    def __init__(self, witness=False, constraints=True):
+        self.scope = "main"
+        self.labels = ["one"]
+        self.values = [1] if witness else None
+        self.constraints = [] if constraints else None
+
+    def label(self, name):
+        return "{}.{}".format(self.scope, name)
+
+    def wire(self, label, value=None):
+        self.labels.append(label)
+        if self.values is not None:
+            self.values.append(value)
+        return len(self.labels) - 1
+
+    def value(self, lc):
+        if self.values is None:
+            return None
+        return sum(coeff * self.values[wire] for wire, coeff in lc.items()) % P
+
+    def constrain(self, a, b, c):
+        if self.constraints is not None:
+            self.constraints.append((a, b, c))
+
+    def constrain_equal(self, left, right):
+        self.constrain({}, {}, lc_add(left, right, -1))
+
+    def mul(self, left, right, label):
+        """Returns a linear combination equal to `left * right`, adding a wire
+        and a constraint unless one of the factors is constant."""
+        constant = lc_constant(left)
+        if constant is not None:
+            return lc_scale(right, constant)
+        constant = lc_constant(right)
+        if constant is not None:
+            return lc_scale(left, constant)
+        value = None
+        if self.values is not None:
+            value = self.value(left) * self.value(right) % P
+        wire = self.wire(label, value)
+        self.constrain(left, right, {wire: 1})
+        return {wire: 1}
+
+
+def write_r1cs(fp, cs, n_outputs, n_public_inputs, n_private_inputs):
+    """Writes `cs` to the binary file `fp` in the iden3 R1CS format (version 1).
+    The wires of `cs` must be ordered as the format requires: the constant one,
+    then the public outputs, public inputs and private inputs."""
+    header = struct.pack("<I", FIELD_BYTES) + P.to_bytes(FIELD_BYTES, "little")
+    header += struct.pack(
+        "<IIIIQI",
+        len(cs.labels),
+        n_outputs,
+        n_public_inputs,
+        n_private_inputs,
+        len(cs.labels),
+        len(cs.constraints),
+    )
+    constraints = bytearray()
+    for constraint in cs.constraints:
+        for lc in constraint:
+            constraints += struct.pack("<I", len(lc))
+            for wire in sorted(lc):
+                constraints += struct.pack("<I", wire)
+                constraints += (lc[wire] % P).to_bytes(FIELD_BYTES, "little")
+    wire_labels = struct.pack("<{}Q".format(len(cs.labels)), *range(len(cs.labels)))
+
+    fp.write(b"r1cs" + struct.pack("<II", 1, 3))
+    for section_type, section in enumerate((header, constraints, wire_labels), 1):
+        fp.write(struct.pack("<IQ", section_type, len(section)))
+        fp.write(section)
+
+
+def write_sym(fp, cs):
+    """Writes the name of every wire of `cs` to the text file `fp`, in the
+    `label,wire,component,name` format of circom's `.sym` files."""
+    for wire, label in enumerate(cs.labels):
+        if wire:
+            fp.write("{},{},0,{}\n".format(wire, wire, label))
+
+
+def write_wtns(fp, values, count, chunk_size=1 << 16):
+    """Writes a witness of `count` wire values, taken from the iterable `values`
+    in wire order, to the binary file `fp` in the iden3 witness format (version
+    2). Values are encoded into a reused buffer and written `chunk_size` at a
+    time, so `values` can be a generator."""
+    header = struct.pack("<I", FIELD_BYTES) + P.to_bytes(FIELD_BYTES, "little")
+    header += struct.pack("<I", count)
+    fp.write(b"wtns" + struct.pack("<II", 2, 2))
+    fp.write(struct.pack("<IQ", 1, len(header)))
+    fp.write(header)
+    fp.write(struct.pack("<IQ", 2, count * FIELD_BYTES))
+
+    buffer = bytearray(chunk_size * FIELD_BYTES)
+    view = memoryview(buffer)
+    offset = 0
+    written = 0
+    for value in values:
+        end = offset + FIELD_BYTES
+        buffer[offset:end] = (value % P).to_bytes(FIELD_BYTES, "little")
+        offset = end
+        if offset == len(buffer):
+            fp.write(view)
+            offset = 0
+        written += 1
+    if offset:
+        fp.write(view[:offset])
+    if written != count:
+        raise Exception("expected {} witness values, got {}".format(count, written))
@@ -0,0 +1,116 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def circuit(arrays):
+    sess = Session()
+    if arrays:
+        xs = sess.input_array("xs", 4)
+        ys = sess.input_array("ys", 4, private=True)
+    else:
+        xs = [sess.input("xs_{}".format(i)) for i in range(4)]
+        ys = [sess.input("ys_{}".format(i), private=True) for i in range(4)]
+    k = sess.input("k")
+    if arrays:
+        scaled = (xs + ys) * k + 1
+    else:
+        scaled = [(x + y) * k + 1 for x, y in zip(xs, ys)]
+    return sess, scaled[1] * scaled[3] - xs[0], scaled
+
+
+def inputs(arrays, xs, ys, k):
+    if arrays:
+        return {"xs": xs, "ys": ys, "k": k}
+    values = {"k": k}
+    for i in range(4):
+        values["xs_{}".format(i)] = xs[i]
+        values["ys_{}".format(i)] = ys[i]
+    return values
+
+
+def test_array_operations_are_loops():
+    sess, out, scaled = circuit(True)
+    code = sess.gen(out)
+    assert "    signal input xs[4];" in code
+    assert "    signal private input ys[4];" in code
+    # the sum and the + 1 are folded into the loops that use them
+    assert code.count("for (var i__ = 0; i__ < 4; i__++) {") == 1
+    assert "xs_plus_ys_times_k__[i__] <== (xs[i__] + ys[i__]) * k;" in code
+
+
+def test_linear_array_operations_are_folded():
+    for fold_linear, lines in ((True, 1), (False, 5)):
+        sess = Session(fold_linear=fold_linear)
+        xs = sess.input_array("xs", 4)
+        ys = sess.input_array("ys", 4)
+        out = (xs + ys) * 3 - ys * sess.param("scale", 2) - 2
+        code = sess.gen(out)
+        # one loop for each signal array
+        assert code.count(" <== ") == lines
+        assert code.count("for (var i__ = 0; i__ < 4; i__++) {") == lines
+        witness = sess.compute_witness(out, {"xs": [1, 2, 3, 4], "ys": [5, 6, 7, 8]})
+        assert witness[out.fullname] == [6, 10, 14, 18]
+        sess.check_witness(out, witness)
+        if fold_linear:
+            assert "[i__] <== 3*xs[i__] + 3*ys[i__] - scale*ys[i__] - 2;" in code
+
+
+def test_arrays_compute_the_same_witness_as_signals():
+    scalar, scalar_out, _ = circuit(False)
+    sess, out, _ = circuit(True)
+    cases = [([1, 2, 3, 4], [5, 6, 7, 8], 3), ([0, -1, 9, 2], [4, 4, 4, 4], 7)]
+    for xs, ys, k in cases:
+        expected = scalar.compute_witness(scalar_out, inputs(False, xs, ys, k))
+        witness = sess.compute_witness(out, inputs(True, xs, ys, k))
+        assert witness[out.fullname] == expected[scalar_out.fullname]
+        assert sess.compile_evaluator(out)(inputs(True, xs, ys, k)) == witness
+        sess.check_witness(out, witness)
+
+
+def test_array_outputs():
+    sess, _, scaled = circuit(True)
+    code = sess.gen(scaled)
+    assert "    signal output {}[4];".format(scaled.fullname) in code
+    values = inputs(True, [1, 2, 3, 4], [5, 6, 7, 8], 3)
+    witness = sess.compute_witness(scaled, values)
+    assert witness[scaled.fullname] == [19, 25, 31, 37]
+    sess.check_witness(scaled, witness)
+
+    cs, n_outputs, n_public, n_private = sess._constraint_system(scaled, values)
+    assert (n_outputs, n_public, n_private) == (4, 5, 4)
+    assert cs.values[1:5] == [19, 25, 31, 37]
+    assert "main.{}[3]".format(scaled.fullname) in cs.labels
+    for a, b, c in cs.constraints:
+        assert cs.value(a) * cs.value(b) % P == cs.value(c)
+
+
+def test_slices_and_elements():
+    sess, _, scaled = circuit(True)
+    part = scaled[1:3] * 2
+    last = scaled[-1]
+    values = inputs(True, [1, 2, 3, 4], [5, 6, 7, 8], 3)
+    assert sess.compute_witness(part, values)[part.fullname] == [50, 62]
+    assert sess.compute_witness(last + 0, values)[(last + 0).fullname] == 37
+    assert list(scaled[2:4])[0].fullname == scaled[2].fullname
+    with pytest.raises(Exception, match="can't be the output of a circuit"):
+        sess.gen(scaled[1:3])
+
+
+def test_arrays_cant_be_detached():
+    sess = Session()
+    xs = sess.input_array("xs", 3)
+    k = sess.input("k").detach()
+    for combine in [
+        lambda: xs + k,
+        lambda: xs * k,
+        lambda: k + xs,
+        lambda: k - xs,
+        lambda: k * xs,
+    ]:
+        with pytest.raises(Exception, match="can't combine the array xs"):
+            combine()
+    with pytest.raises(Exception, match="arrays can't be detached"):
+        xs.detach()
+    assert (xs * k.attach()).length == 3
@@ -0,0 +1,68 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def test_inferred_bounds():
+    sess = Session()
+    age = sess.input("age", private=True, bounds=(0, 150))
+    months = sess.input("months", bounds=(-3, 11))
+    x = sess.input("x")
+    assert (age * 12 + months).bounds == (-3, 1811)
+    assert (age - 200).bounds == (-200, -50)
+    assert (age * age).bounds == (0, 22500)
+    assert sess.sum([age, months, 4]).bounds == (1, 165)
+    assert sess.constant(-7).bounds == (-7, -7)
+    assert (age + x).bounds is None
+    assert (age * 2).bit_width == 9
+    assert (age - 200).bit_width is None
+    assert x.bit_width is None
+
+
+def test_detached_bounds():
+    sess = Session()
+    age = sess.input("age", bounds=(0, 150))
+    doubled = age.detach() * 2
+    assert age.detach().bounds == (0, 150)
+    assert doubled.bounds == (0, 300)
+    # the prover could attach anything
+    assert doubled.attach().bounds is None
+
+
+def test_declared_bounds_are_checked():
+    sess = Session()
+    age = sess.input("age", bounds=(0, 150))
+    out = age * 3
+    for value in (0, 150):
+        sess.check_witness(out, sess.compute_witness(out, {"age": value}))
+    for value in (151, -1, 256):
+        witness = sess.compute_witness(out, {"age": value})
+        with pytest.raises(Exception, match="is checked to equal"):
+            sess.check_witness(out, witness)
+    for bounds in [(5, 1), (0, P)]:
+        with pytest.raises(Exception, match="invalid bounds"):
+            sess.input("y", bounds=bounds)
+
+
+def test_bits():
+    sess = Session()
+    x = sess.input("x")
+    age = sess.input("age", bounds=(0, 150))
+    assert len(sess.bits(x)) == P.bit_length()
+    bits = sess.bits(x, 10)
+    assert len(bits) == 10
+    assert sess.bits(x, 10) is bits
+    assert x.bounds == (0, 1023)
+    assert x.bit_width == 10
+    assert len(sess.bits(age)) == 8
+    assert len(sess.bits(age * 12 + 5)) == 11
+    assert all(bit.bounds == (0, 1) for bit in bits)
+
+    out = sess.sum(bits[i] * (i + 1) for i in range(10))
+    witness = sess.compute_witness(out, {"x": 0b1000000101, "age": 3})
+    assert witness[out.fullname] == 1 + 3 + 10
+    sess.check_witness(out, witness)
+    witness = sess.compute_witness(out, {"x": 1024, "age": 3})
+    with pytest.raises(Exception, match="is checked to equal x"):
+        sess.check_witness(out, witness)
@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.cache import BuildCache
+
+
+def circuit(use_template=False, **options):
+    sess = Session(**options)
+    x = sess.input("x")
+    y = sess.input("y", private=True)
+
+    def polynomial(x, y):
+        return (x * x + y) * (y * y + x * 3)
+
+    if use_template:
+        polynomial = sess.template(polynomial)
+    out = polynomial(x, y) * polynomial(y, x)
+    (x * y).check_equals(y + 2)
+    return sess, out
+
+
+def test_fingerprint_ignores_names():
+    fingerprints = set()
+    for options in ({}, {"max_name_length": 8}, {"debug_names": True}):
+        sess, out = circuit(**options)
+        fingerprints.add(sess.fingerprint(out))
+    assert len(fingerprints) == 1
+
+
+def test_fingerprint_depends_on_the_circuit():
+    sess, out = circuit()
+    before = sess.fingerprint(out)
+    assert sess.fingerprint(out) == before
+    assert sess.fingerprint(out * out) != before
+    out.check_equals(3)
+    assert sess.fingerprint(out) != before
+    sess, out = circuit(fold_linear=False)
+    assert sess.fingerprint(out) != before
+
+
+def test_fingerprint_with_names():
+    for use_template in (False, True):
+        sessions = [
+            circuit(use_template, **options)
+            for options in ({}, {}, {"max_name_length": 8}, {"debug_names": True})
+        ]
+        fingerprints = [sess.fingerprint(out, names=True) for sess, out in sessions]
+        assert fingerprints[0] == fingerprints[1]
+        assert len(set(fingerprints)) == 3
+
+
+def test_build_cache(tmp_path):
+    cache = BuildCache(str(tmp_path))
+    calls = []
+
+    def build(path):
+        calls.append(path)
+        with open(path, "w") as fp:
+            fp.write("key")
+        with open(os.path.splitext(path)[0] + ".sym", "w") as fp:
+            fp.write("sym")
+
+    assert cache.get("abc", "circuit.zkey") is None
+    path = cache.build("abc", "circuit.zkey", build)
+    assert cache.build("abc", "circuit.zkey", build) == path
+    assert cache.get("abc", "circuit.zkey") == path
+    assert len(calls) == 1
+    assert open(path).read() == "key"
+    assert open(os.path.join(str(tmp_path), "abc", "circuit.sym")).read() == "sym"
+
+
+def test_failed_builds_leave_nothing(tmp_path):
+    cache = BuildCache(str(tmp_path))
+
+    def fail(path):
+        with open(path, "w") as fp:
+            fp.write("partial")
+        raise RuntimeError("setup failed")
+
+    with pytest.raises(RuntimeError):
+        cache.build("abc", "circuit.zkey", fail)
+    with pytest.raises(Exception, match="didn't write"):
+        cache.build("abc", "circuit.zkey", lambda path: None)
+    assert cache.get("abc", "circuit.zkey") is None
+    assert os.listdir(os.path.join(str(tmp_path), "abc")) == []
+
+
+def test_gen_is_cached_by_names(tmp_path):
+    cache = BuildCache(str(tmp_path))
+    for options in ({}, {"max_name_length": 8}, {}):
+        sess, out = circuit(True, **options)
+        path = cache.gen(sess, out)
+        assert open(path).read() == sess.gen(out)
+    assert len(os.listdir(str(tmp_path))) == 2
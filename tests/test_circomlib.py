@@ -0,0 +1,82 @@
+import pytest
+
+from knowledgeflow import Session, circomlib
+from knowledgeflow.field import P
+from knowledgeflow.r1cs import ConstraintSystem
+
+CASES = [
+    ("Num2Bits", [8], {"in": 0b10110101}),
+    ("LessThan", [8], {"in": [3, 200]}),
+    ("LessThan", [8], {"in": [200, 3]}),
+    ("LessThan", [8], {"in": [7, 7]}),
+    ("Sign", [], {"in": [(5 >> i) & 1 for i in range(254)]}),
+    ("Sign", [], {"in": [((P - 5) >> i) & 1 for i in range(254)]}),
+    ("QuinSelector", [4], {"in": [10, 20, 30, 40], "index": 2}),
+    ("MultiRangeProof", [2, 10, 100], {"in": [-100, 99]}),
+    ("MiMCSponge", [2, 220, 2], {"ins": [1, 2], "k": 3}),
+]
+
+
+def test_evaluators():
+    assert circomlib.num2bits([4], {"in": 6}) == {"out": [0, 1, 1, 0]}
+    assert circomlib.less_than([8], {"in": [3, 200]}) == {"out": 1}
+    assert circomlib.less_than([8], {"in": [200, 3]}) == {"out": 0}
+    assert circomlib.sign([], {"in": [1] + [0] * 253}) == {"sign": 0}
+    minus_one = [((P - 1) >> i) & 1 for i in range(254)]
+    assert circomlib.sign([], {"in": minus_one}) == {"sign": 1}
+    selected = circomlib.quin_selector([3], {"in": [4, 5, 6], "index": 1})
+    assert selected == {"out": 5}
+
+
+def test_mimc_constants():
+    constants = circomlib.MIMC_CONSTANTS
+    assert len(constants) == 220
+    assert constants[0] == constants[-1] == 0
+    assert constants[1] == int(
+        "7120861356467848435263064379192047478074060781135320967663101236819528304084"
+    )
+
+
+@pytest.mark.parametrize("name, args, values", CASES)
+def test_builders_agree_with_evaluators(name, args, values):
+    builtin = circomlib.BUILTINS[name]
+    cs = ConstraintSystem(witness=True)
+    inputs = {}
+    for key, value in values.items():
+        if isinstance(value, list):
+            inputs[key] = [{cs.wire(key, element % P): 1} for element in value]
+        else:
+            inputs[key] = {cs.wire(key, value % P): 1}
+    outputs = builtin.build(cs, args, inputs, "main.c")
+    for a, b, c in cs.constraints:
+        assert cs.value(a) * cs.value(b) % P == cs.value(c)
+    reduced = {
+        key: [v % P for v in value] if isinstance(value, list) else value % P
+        for key, value in values.items()
+    }
+    expected = builtin.evaluate(args, reduced)
+    for key, lc in outputs.items():
+        if isinstance(lc, list):
+            assert [cs.value(item) for item in lc] == expected[key]
+        else:
+            assert cs.value(lc) == expected[key]
+    assert len(cs.constraints) <= builtin.cost(args) + 1
+
+
+def test_builder_rejects_out_of_range_values():
+    cs = ConstraintSystem(witness=True)
+    builtin = circomlib.BUILTINS["MultiRangeProof"]
+    builtin.build(cs, [1, 10, 100], {"in": [{cs.wire("in", 101): 1}]}, "main.c")
+    assert any(
+        cs.value(a) * cs.value(b) % P != cs.value(c) for a, b, c in cs.constraints
+    )
+
+
+def test_externs_use_builtin_evaluators():
+    sess = Session()
+    x = sess.input("x")
+    num2bits = sess.extern("Num2Bits", args=[4], inputs={"in": 1}, output=["out"])
+    bits = num2bits(_in=x)
+    out = bits[0] + bits[1] * 2 + bits[3] * 8
+    assert sess.compute_witness(out, {"x": 11})[out.fullname] == 11
+    assert num2bits.cost == 5
@@ -0,0 +1,71 @@
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def circuit(**options):
+    sess = Session(**options)
+    range_proof = sess.extern("MultiRangeProof", args=[1, 10, 100], inputs={"in": [1]})
+    num2bits = sess.extern("Num2Bits", args=[4], inputs={"in": 1}, output=["out"])
+    xs = [sess.input(name) for name in "abc"]
+    for x in xs + xs[:1]:
+        range_proof(_in=[x])
+    bits = [num2bits(_in=x) for x in xs]
+    out = sess.sum(b[0] * (i + 1) for i, b in enumerate(bits)) * bits[2][3]
+    return sess, out
+
+
+INPUTS = [{"a": 1, "b": 3, "c": 14}, {"a": 0, "b": 15, "c": 8}]
+
+
+def test_fused_components_are_named_after_the_first_call():
+    sess, out = circuit(fuse_externs=True)
+    code = sess.gen(out)
+    assert "    component Num2Bits_0[3];" in code
+    assert "        Num2Bits_0[i__] = Num2Bits(4);" in code
+    assert "    Num2Bits_2[" not in code
+    assert "Num2Bits_0[2].out[3]" in code
+    # all four range checks become one, checking each signal once
+    assert code.count("= MultiRangeProof(") == 1
+    assert "    component MultiRangeProof_0 = MultiRangeProof(3, 10, 100);" in code
+    assert "    MultiRangeProof_0.in[2] <== c;" in code
+
+
+def test_fused_components_compute_the_same_witness():
+    separate, separate_out = circuit()
+    sess, out = circuit(fuse_externs=True)
+    for inputs in INPUTS:
+        expected = separate.compute_witness(separate_out, inputs)
+        expected = expected[separate_out.fullname]
+        witness = sess.compute_witness(out, inputs)
+        assert witness[out.fullname] == expected
+        sess.check_witness(out, witness)
+        cs, _, _, _ = sess._constraint_system(out, inputs)
+        assert cs.values[1] == expected
+        for a, b, c in cs.constraints:
+            assert cs.value(a) * cs.value(b) % P == cs.value(c)
+    assert "main.Num2Bits_0[1].out[0]" in cs.labels
+
+
+def test_incremental_fusing_matches_full_regeneration():
+    incremental, incremental_out = circuit(fuse_externs=True, incremental=True)
+    full, full_out = circuit(fuse_externs=True)
+    assert incremental.gen(incremental_out) == full.gen(full_out)
+    for sess, out in [(incremental, incremental_out), (full, full_out)]:
+        num2bits = sess.extern("Num2Bits", args=[4], inputs={"in": 1}, output=["out"])
+        more = num2bits(_in=out)
+        sess.constant(0).check_equals(more[1])
+    assert incremental.gen(incremental_out) == full.gen(full_out)
+
+
+def test_turning_fusing_off():
+    for incremental in (False, True):
+        sess, out = circuit(fuse_externs=True, incremental=incremental)
+        fused = sess.gen(out)
+        sess.fuse_externs = False
+        separate, separate_out = circuit()
+        assert sess.gen(out) == separate.gen(separate_out)
+        witness = sess.compute_witness(out, INPUTS[0])
+        assert witness == separate.compute_witness(separate_out, INPUTS[0])
+        sess.check_witness(out, witness)
+        sess.fuse_externs = True
+        assert sess.gen(out) == fused
@@ -0,0 +1,108 @@
+import builtins
+
+import pytest
+
+from knowledgeflow import Session, gadgets
+from knowledgeflow.field import P
+
+GADGETS = [
+    ("is_zero", lambda x, y: gadgets.is_zero(x), lambda x, y: int(x == 0)),
+    ("is_equal", lambda x, y: gadgets.is_equal(x, 5), lambda x, y: int(x == 5)),
+    ("less_than", gadgets.less_than, lambda x, y: int(x < y)),
+    ("is_negative", lambda x, y: gadgets.is_negative(x), lambda x, y: int(x < 0)),
+    ("abs", lambda x, y: gadgets.abs(x), lambda x, y: builtins.abs(x)),
+    ("floor_div", gadgets.floor_div, lambda x, y: x // y),
+    ("modulo", gadgets.modulo, lambda x, y: x % y),
+    (
+        "mux",
+        lambda x, y: gadgets.mux(gadgets.is_negative(x), 1, y),
+        lambda x, y: 1 if x < 0 else y,
+    ),
+]
+
+
+def circuit():
+    sess = Session()
+    x = sess.input("x", bounds=(-100, 100))
+    y = sess.input("y", private=True, bounds=(1, 7))
+    return sess, x, y
+
+
+@pytest.mark.parametrize("name, gadget, expected", GADGETS)
+def test_gadgets(name, gadget, expected):
+    sess, x, y = circuit()
+    out = gadget(x, y)
+    results = set()
+    for x_value in (-100, -9, -1, 0, 5, 6, 100):
+        for y_value in (1, 3, 7):
+            witness = sess.compute_witness(out, {"x": x_value, "y": y_value})
+            sess.check_witness(out, witness)
+            result = expected(x_value, y_value)
+            assert witness[out.fullname] == result % P
+            low, high = out.bounds
+            assert low <= result <= high
+            results.add(result)
+    assert len(results) > 1
+
+
+def test_gadgets_fold_known_results():
+    sess, x, y = circuit()
+    assert gadgets.is_zero(y).fullname == "0"
+    assert gadgets.is_negative(y).fullname == "0"
+    assert gadgets.is_negative(y - 8).fullname == "1"
+    assert gadgets.less_than(y, 8).fullname == "1"
+    assert gadgets.less_than(8, y).fullname == "0"
+    assert gadgets.is_zero(x * 0 + 0).fullname == "1"
+
+
+def test_gadgets_take_numbers():
+    sess, x, y = circuit()
+    out = gadgets.mux(1, x, 3) + gadgets.mux(0, x, 3) + gadgets.less_than(2, y)
+    witness = sess.compute_witness(out, {"x": 10, "y": 3})
+    assert witness[out.fullname] == 10 + 3 + 1
+    for gadget in (gadgets.is_zero, gadgets.is_negative, gadgets.abs):
+        with pytest.raises(Exception, match="expected at least one signal"):
+            gadget(4)
+    with pytest.raises(Exception, match="expected at least one signal"):
+        gadgets.mux(1, 2, 3)
+
+
+def test_gadgets_need_bounds():
+    sess = Session()
+    x = sess.input("x")
+    with pytest.raises(Exception, match="the bounds of x aren't known"):
+        gadgets.less_than(x, 3)
+    with pytest.raises(Exception, match="the bounds of x aren't known"):
+        gadgets.modulo(x, 3)
+
+
+def test_mux_checks_its_predicate():
+    sess, x, y = circuit()
+    pred = sess.input("pred")
+    out = gadgets.mux(pred, x, y)
+    sess.check_witness(out, sess.compute_witness(out, {"x": 2, "y": 3, "pred": 1}))
+    witness = sess.compute_witness(out, {"x": 2, "y": 3, "pred": 2})
+    with pytest.raises(Exception, match="is checked to equal 0"):
+        sess.check_witness(out, witness)
+
+
+def test_div_mod():
+    sess, x, y = circuit()
+    quotient, remainder = gadgets.div_mod(x, y)
+    assert gadgets.div_mod(x, y) == (quotient, remainder)
+    assert quotient.bounds == (-100, 100)
+    assert remainder.bounds == (0, 6)
+    with pytest.raises(Exception, match="can't be positive"):
+        gadgets.modulo(x, y - 7)
+
+
+def test_div_mod_range_covers_every_checked_quotient():
+    sess = Session()
+    # the quotient is checked with 201 bits, so it can reach almost 2**201,
+    # and its product with the divisor could wrap around the field
+    dividend = sess.input("dividend", bounds=(0, 2**200))
+    divisor = sess.input("divisor", bounds=(1, 2**52))
+    with pytest.raises(Exception, match="too large"):
+        gadgets.div_mod(dividend, divisor)
+    quotient, _ = gadgets.div_mod(dividend, divisor + 2**48)
+    assert quotient.bounds == (0, 2**200 // (2**48 + 1))
@@ -0,0 +1,172 @@
+import textwrap
+
+from knowledgeflow import Session
+
+
+def circom(text):
+    return "\n\n" + textwrap.dedent(text).strip()
+
+
+def test_gen_product():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b", private=True)
+    assert sess.gen(a * b) == circom(
+        """
+        template Main() {
+            signal input a;
+            signal private input b;
+            signal output a_times_b__;
+
+            a_times_b__ <== a * b;
+        }
+
+        component main = Main();
+        """
+    )
+
+
+def test_gen_deep_graph():
+    # deeper than the recursion limit
+    sess = Session(fold_linear=False)
+    x = sess.input("x")
+    y = x
+    for _ in range(5000):
+        y = y * x
+    code = sess.gen(y)
+    assert code.count(" <== ") == 5000
+    assert code.count("signal ") == 5001
+
+
+def test_gen_orders_statements_after_their_operands():
+    sess = Session(fold_linear=False)
+    a = sess.input("a")
+    b = sess.input("b")
+    c = a * b
+    d = c * c + a
+    e = d * b
+    e.check_equals(c)
+    lines = [line.strip() for line in sess.gen(d).splitlines()]
+    assigned = [line.split(" <== ")[0] for line in lines if " <== " in line]
+    assert assigned == [c.fullname, (c * c).fullname, d.fullname, e.fullname]
+    assert lines.index("{} === {};".format(e.fullname, c.fullname)) > lines.index(
+        "{} <== {} * b;".format(e.fullname, d.fullname)
+    )
+
+
+def test_names_are_truncated():
+    sess = Session(max_name_length=8)
+    a = sess.input("alpha")
+    b = sess.input("beta")
+    names = [node.fullname for node in (a * b, a * b * b, a * b * b * a)]
+    assert names == ["alpha_ti__", "alpha_ti_0__", "alpha_ti_1__"]
+
+
+def test_debug_names_describe_the_expression():
+    sess = Session(debug_names=True)
+    a = sess.input("a")
+    b = sess.input("b")
+    assert (a * b * b * a * b).fullname == "a_times_b_times_b_times_a_times_b__"
+
+
+def test_names_are_unique():
+    sess = Session(cse=False)
+    a = sess.input("a")
+    nodes = [a * a for _ in range(100)]
+    names = [node.fullname for node in nodes]
+    assert len(set(names)) == 100
+    assert names[:3] == ["a_times_a__", "a_times_a_0__", "a_times_a_1__"]
+    code = sess.gen(sess.sum(nodes))
+    for name in names:
+        assert "signal {};".format(name) in code
+
+
+def test_identical_nodes_are_shared():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b")
+    assert a * b is a * b
+    assert (a * b + 1) * 3 is (a * b + 1) * 3
+    assert a * b is not b * a
+    assert sess.gen(a * b * (a * b)).count("<== a * b;") == 1
+
+
+def test_cse_can_be_disabled():
+    sess = Session(cse=False)
+    a = sess.input("a")
+    assert a * a is not a * a
+
+
+def test_pure_extern_calls_are_shared():
+    sess = Session()
+    a = sess.input("a")
+    pure = sess.extern("F", inputs={"in": 1}, output="out", pure=True)
+    impure = sess.extern("G", inputs={"in": 1}, output="out")
+    assert pure(_in=a) is pure(_in=a)
+    assert impure(_in=a) is not impure(_in=a)
+    code = sess.gen(pure(_in=a) + pure(_in=a) + impure(_in=a))
+    assert code.count("component F_") == 1
+    assert code.count("component G_") == 3
+
+
+def test_linear_operations_are_folded():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b")
+    c = a + b * 3 - 2
+    d = c * c
+    assert sess.gen(d + c) == circom(
+        """
+        template Main() {
+            signal input a;
+            signal input b;
+            signal a_plus_b_times_c3_minus_c2_times__;
+            signal output a_plus_b_times_c3_minus_c2_times_0__;
+
+            a_plus_b_times_c3_minus_c2_times__ <== (a + 3*b - 2) * (a + 3*b - 2);
+            a_plus_b_times_c3_minus_c2_times_0__ <== a_plus_b_times_c3_minus_c2_times__ + a + 3*b - 2;
+        }
+
+        component main = Main();
+        """
+    )
+
+
+def test_constrained_products_are_inlined():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b")
+    ((a - b) * (a + b)).check_equals(a * 5)
+    code = sess.gen(a * b)
+    assert "    (a - b) * (a + b) === 5*a;" in code.splitlines()
+    assert code.count("signal ") == 3
+
+
+def test_folding_can_be_disabled():
+    sess = Session(fold_linear=False)
+    a = sess.input("a")
+    b = sess.input("b")
+    code = sess.gen(a + b * 3)
+    assert "    b_times_c3__ <== b * 3;" in code.splitlines()
+    assert "    a_plus_b_times_c3__ <== a + b_times_c3__;" in code.splitlines()
+
+
+class RecordingFile:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, text):
+        self.writes.append(text)
+
+
+def test_gen_to_writes_the_same_code_in_chunks():
+    sess = Session()
+    x = sess.input("x")
+    y = x
+    for i in range(200):
+        y = y * x + i
+    fp = RecordingFile()
+    sess.gen_to(y, fp, chunk_size=1000)
+    assert "".join(fp.writes) == sess.gen(y)
+    assert len(fp.writes) > 5
+    assert all(len(text) < 2000 for text in fp.writes)
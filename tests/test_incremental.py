@@ -0,0 +1,71 @@
+import random
+
+from knowledgeflow import Session
+
+
+class Lockstep:
+    """Builds the same circuit in an incremental session and in a session that
+    regenerates everything, so that their code can be compared."""
+    def __init__(self, **options):
+        self.sessions = [
+            Session(incremental=True, **options),
+            Session(incremental=False, **options),
+        ]
+        self.nodes = [[sess.input("a") for sess in self.sessions]]
+        self.add(lambda sess: sess.input("b", private=True))
+
+    def add(self, build, *operands):
+        self.nodes.append(
+            [
+                build(sess, *(self.nodes[i][k] for i in operands))
+                for k, sess in enumerate(self.sessions)
+            ]
+        )
+        return len(self.nodes) - 1
+
+    def check_equals(self, left, right):
+        for k in range(2):
+            self.nodes[left][k].check_equals(self.nodes[right][k])
+
+    def gen(self, i):
+        incremental, full = (
+            sess.gen(node) for sess, node in zip(self.sessions, self.nodes[i])
+        )
+        assert incremental == full
+        return incremental
+
+
+def test_alternating_outputs_after_new_constraints():
+    circuit = Lockstep()
+    b = 1
+    c = circuit.add(lambda sess, b: b + b, b)
+    d = circuit.add(lambda sess, b: b * 1, b)
+    circuit.gen(d)
+    circuit.gen(c)
+    e = circuit.add(lambda sess, d: d * 1, d)
+    circuit.check_equals(d, e)
+    circuit.gen(d)
+    assert "    b === b;" in circuit.gen(c).splitlines()
+
+
+def test_incremental_matches_full_regeneration():
+    rng = random.Random(1)
+    operations = [
+        lambda sess, x, y: x + y,
+        lambda sess, x, y: x - y,
+        lambda sess, x, y: x * y,
+        lambda sess, x, y: x * 3 + 1,
+        lambda sess, x, y: (x.detach() + y).attach(),
+    ]
+    for options in ({}, {"fold_linear": False}):
+        circuit = Lockstep(**options)
+        for _ in range(300):
+            choice = rng.random()
+            x = rng.randrange(len(circuit.nodes))
+            y = rng.randrange(len(circuit.nodes))
+            if choice < 0.6:
+                circuit.add(rng.choice(operations), x, y)
+            elif choice < 0.75:
+                circuit.check_equals(x, y)
+            else:
+                circuit.gen(x)
@@ -0,0 +1,88 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def circuit(public=False, **options):
+    sess = Session(**options)
+    x = sess.input("x")
+    y = sess.input("y", private=True)
+    scale = sess.param("scale", 2, public=public)
+    out = x * scale * 3 + y * (scale + 1) + x * y
+    return sess, out
+
+
+CASES = [({"x": 5, "y": 7}, 2), ({"x": 5, "y": 7, "scale": 10}, 10)]
+
+
+def expected(x, y, scale):
+    return (x * scale * 3 + y * (scale + 1) + x * y) % P
+
+
+def test_params_are_parameters_of_main():
+    sess, out = circuit()
+    code = sess.gen(out)
+    assert "template Main(scale) {" in code
+    assert code.endswith("component main = Main(2);")
+    assert sess.gen(out, params={"scale": 512}).endswith("component main = Main(512);")
+    assert "component main" not in sess.gen(out, main=False)
+    assert sess.gen_mains("circuit.circom", [{}, {"scale": 7}]) == [
+        'include "circuit.circom";\n\ncomponent main = Main(2);',
+        'include "circuit.circom";\n\ncomponent main = Main(7);',
+    ]
+    with pytest.raises(Exception, match="no params named size"):
+        sess.gen(out, params={"size": 3})
+
+
+def test_multiplying_by_params_is_linear():
+    sess, out = circuit()
+    code = sess.gen(out)
+    # only the product of two signals gets a signal of its own
+    assert code.count(" <== ") == 2
+    assert " <== 3*scale*x + y + scale*y + x_times_y__;" in code
+
+
+def test_witnesses_use_param_values():
+    for options in ({}, {"fold_linear": False}):
+        sess, out = circuit(**options)
+        for inputs, scale in CASES:
+            witness = sess.compute_witness(out, inputs)
+            assert witness["scale"] == scale
+            assert witness[out.fullname] == expected(5, 7, scale)
+            assert sess.compile_evaluator(out)(inputs) == witness
+            sess.check_witness(out, witness)
+
+
+def test_check_witness_uses_the_recorded_params():
+    sess = Session()
+    x = sess.input("x")
+    out = x * sess.param("scale", 2)
+    witness = sess.compute_witness(out, {"x": 10, "scale": 10})
+    assert witness[out.fullname] == 100
+    sess.check_witness(out, witness)
+    witness["scale"] = 2
+    with pytest.raises(Exception, match="is 100, but should be 20"):
+        sess.check_witness(out, witness)
+
+
+def test_public_params():
+    sess, out = circuit(public=True)
+    code = sess.gen(out)
+    assert "template Main() {" in code
+    assert "    signal input scale;" in code
+    # scale is a signal, so multiplying by it is a constraint
+    assert code.count(" <== ") == 4
+    for inputs, scale in CASES:
+        witness = sess.compute_witness(out, inputs)
+        assert witness[out.fullname] == expected(5, 7, scale)
+        sess.check_witness(out, witness)
+
+
+def test_params_must_be_unique():
+    sess = Session()
+    sess.input("x")
+    sess.param("scale", 2)
+    for name in ("x", "scale"):
+        with pytest.raises(Exception, match="not unique"):
+            sess.param(name, 3)
@@ -0,0 +1,53 @@
+import io
+
+import pytest
+
+from knowledgeflow import Session
+
+
+def square(x):
+    return x * x
+
+
+def cube(x):
+    return square(x) * x
+
+
+def circuit():
+    sess = Session(track_origins=True)
+    x = sess.input("x")
+    check = sess.extern(
+        "Check", inputs={"in": 1}, evaluator=lambda args, inputs: {}, cost=10
+    )
+    check(_in=x)
+    return sess, cube(x) + square(x + 1) * 3
+
+
+def test_profile_attributes_costs_to_functions():
+    sess, out = circuit()
+    totals = dict(sess.profile(out).functions())
+    # x * x, (x + 1) * (x + 1), x * x * x and the output
+    assert totals["test_profile.py:square"] == [2, 2, 0, 2]
+    assert totals["test_profile.py:cube"] == [2, 2, 0, 2]
+    assert totals["test_profile.py:circuit"] == [5, 3, 10, 13]
+
+
+def test_profile_table_and_collapsed_stacks():
+    sess, out = circuit()
+    profile = sess.profile(out)
+    lines = profile.table().splitlines()
+    assert lines[0].split() == list(profile.COLUMNS) + ["function"]
+    rows = [" ".join(line.split()) for line in lines]
+    assert "5 3 10 13 test_profile.py:circuit" in rows
+    fp = io.StringIO()
+    profile.write_collapsed(fp)
+    stacks = dict(line.rsplit(" ", 1) for line in fp.getvalue().splitlines())
+    assert sum(int(total) for total in stacks.values()) == 13
+    assert any(stack.endswith("circuit;test_profile.py:cube") for stack in stacks)
+
+
+def test_profile_needs_origins():
+    sess = Session()
+    x = sess.input("x")
+    with pytest.raises(Exception, match="track_origins"):
+        sess.profile(x * x)
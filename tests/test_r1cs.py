@@ -0,0 +1,150 @@
+import io
+import struct
+
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+from knowledgeflow.r1cs import lc_add, lc_constant, lc_scale, write_wtns
+
+
+def read_sections(data, magic):
+    assert data[:4] == magic
+    _, count = struct.unpack_from("<II", data, 4)
+    offset = 12
+    sections = {}
+    for _ in range(count):
+        section_type, size = struct.unpack_from("<IQ", data, offset)
+        offset += 12
+        sections[section_type] = data[offset : offset + size]
+        offset += size
+    assert offset == len(data)
+    return sections
+
+
+def read_r1cs(path):
+    sections = read_sections(open(path, "rb").read(), b"r1cs")
+    header = sections[1]
+    assert struct.unpack_from("<I", header) == (32,)
+    assert int.from_bytes(header[4:36], "little") == P
+    wires, outputs, public, private, labels, count = struct.unpack_from(
+        "<IIIIQI", header, 36
+    )
+    constraints = []
+    data, offset = sections[2], 0
+    for _ in range(count):
+        constraint = []
+        for _ in range(3):
+            [terms] = struct.unpack_from("<I", data, offset)
+            offset += 4
+            lc = {}
+            for _ in range(terms):
+                [wire] = struct.unpack_from("<I", data, offset)
+                lc[wire] = int.from_bytes(data[offset + 4 : offset + 36], "little")
+                offset += 36
+            constraint.append(lc)
+        constraints.append(constraint)
+    assert offset == len(data)
+    assert labels == wires
+    return wires, (outputs, public, private), constraints
+
+
+def read_wtns(path):
+    sections = read_sections(open(path, "rb").read(), b"wtns")
+    [count] = struct.unpack_from("<I", sections[1], 36)
+    data = sections[2]
+    assert len(data) == count * 32
+    return [int.from_bytes(data[i : i + 32], "little") for i in range(0, len(data), 32)]
+
+
+def value(lc, witness):
+    return sum(coeff * witness[wire] for wire, coeff in lc.items()) % P
+
+
+def circuit():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b", private=True)
+    num2bits = sess.extern("Num2Bits", args=[4], inputs={"in": 1}, output=["out"])
+    bits = num2bits(_in=b)
+    q = (a.detach() / b.detach()).attach()
+    a.check_equals(q * b)
+    out = q * q + bits[0] * 3 - a + bits[2] * bits[3]
+    return sess, out
+
+
+def test_linear_combinations():
+    assert lc_add({0: 1, 1: 2}, {1: P - 2, 2: 5}) == {0: 1, 2: 5}
+    assert lc_add({1: 2}, {1: 1}, -2) == {}
+    assert lc_scale({1: 3, 2: 4}, 0) == {}
+    assert lc_scale({1: 3}, -1) == {1: P - 3}
+    assert lc_constant({0: 7}) == 7
+    assert lc_constant({}) == 0
+    assert lc_constant({0: 7, 3: 1}) is None
+
+
+def test_r1cs(tmp_path):
+    sess, out = circuit()
+    path = str(tmp_path / "circuit.r1cs")
+    sess.to_r1cs(out, path)
+    wires, counts, constraints = read_r1cs(path)
+    assert counts == (1, 1, 1)
+    symbols = open(str(tmp_path / "circuit.sym")).read().splitlines()
+    assert len(symbols) == wires - 1
+    assert symbols[:3] == [
+        "1,1,0,main.{}".format(out.fullname),
+        "2,2,0,main.a",
+        "3,3,0,main.b",
+    ]
+    assert any(line.endswith("main.Num2Bits_0.out[3]") for line in symbols)
+
+
+def test_r1cs_folds_linear_operations(tmp_path):
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b")
+    out = (a + b * 3) * (a - 2) + b * 5
+    path = str(tmp_path / "circuit.r1cs")
+    sess.to_r1cs(out, path)
+    wires, _, constraints = read_r1cs(path)
+    # the product and the output
+    assert wires == 5
+    assert len(constraints) == 2
+
+
+def test_wtns_satisfies_the_r1cs(tmp_path):
+    sess, out = circuit()
+    path = str(tmp_path / "circuit.r1cs")
+    sess.to_r1cs(out, path)
+    wires, _, constraints = read_r1cs(path)
+    for a, b in [(12, 4), (5, 15), (-3, 9)]:
+        wtns = str(tmp_path / "witness.wtns")
+        sess.to_wtns(out, {"a": a, "b": b}, wtns)
+        witness = read_wtns(wtns)
+        assert len(witness) == wires
+        assert witness[:4] == [
+            1,
+            sess.compute_witness(out, {"a": a, "b": b})[out.fullname],
+            a % P,
+            b,
+        ]
+        for lcs in constraints:
+            left, right, product = (value(lc, witness) for lc in lcs)
+            assert left * right % P == product
+
+    # a wrong witness breaks a constraint
+    witness[4] += 1
+    assert any(
+        value(a, witness) * value(b, witness) % P != value(c, witness)
+        for a, b, c in constraints
+    )
+
+
+def test_write_wtns_streams_values(tmp_path):
+    path = str(tmp_path / "witness.wtns")
+    values = [1, P - 1, 2**200, 7, 0]
+    with open(path, "wb") as fp:
+        write_wtns(fp, (value for value in values), len(values), chunk_size=2)
+    assert read_wtns(path) == values
+    with pytest.raises(Exception, match="expected 6"):
+        write_wtns(io.BytesIO(), iter(values), 6)
@@ -0,0 +1,71 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+TABLE = [5, 9, -2, 7, 11]
+
+
+def test_select():
+    sess = Session()
+    index = sess.input("i")
+    value = sess.select(TABLE, index)
+    for i, expected in enumerate(TABLE):
+        witness = sess.compute_witness(value, {"i": i})
+        assert witness[value.fullname] == expected % P
+        sess.check_witness(value, witness)
+        assert sess.compile_evaluator(value)({"i": i}) == witness
+    assert value.bounds == (-2, 11)
+    assert index.bounds == (0, 4)
+
+
+def test_select_checks_the_index():
+    sess = Session()
+    index = sess.input("i")
+    value = sess.select(TABLE, index)
+    code = sess.gen(value)
+    # three bits, their four products, and the value
+    assert code.count(" <== ") == 5
+    assert code.count(" === ") == 5
+    for i in (5, 7):
+        witness = sess.compute_witness(value, {"i": i})
+        with pytest.raises(Exception, match="is checked to equal 0"):
+            sess.check_witness(value, witness)
+
+
+def test_select_without_a_range_check():
+    sess = Session()
+    index = sess.input("i", bounds=(0, 3))
+    value = sess.select([4, 3, 2, 1], index)
+    code = sess.gen(value)
+    assert code.count(" === ") == 3
+    assert sess.compute_witness(value, {"i": 3})[value.fullname] == 1
+
+
+def test_select_many_shares_the_bits():
+    sess = Session()
+    index = sess.input("i")
+    first, second = sess.select_many([[1, 2, 3, 4], [4, 3, 2, 1]], index)
+    out = first * second
+    code = sess.gen(out)
+    assert code.count("_bit_c0__ <-- ") == 1
+    assert code.count("_bit_c1__ <-- ") == 1
+    for i in range(4):
+        witness = sess.compute_witness(out, {"i": i})
+        assert witness[out.fullname] == (i + 1) * (4 - i)
+        sess.check_witness(out, witness)
+
+
+def test_select_special_cases():
+    sess = Session()
+    index = sess.input("i")
+    assert sess.select([1, 2], 1).fullname == "2"
+    single = sess.select([7], index)
+    assert single.fullname == "7"
+    witness = sess.compute_witness(single * index, {"i": 1})
+    with pytest.raises(Exception, match="is checked to equal 0"):
+        sess.check_witness(single * index, witness)
+    with pytest.raises(Exception, match="same nonzero size"):
+        sess.select_many([[1, 2], [3]], index)
+    with pytest.raises(Exception, match="same nonzero size"):
+        sess.select([], index)
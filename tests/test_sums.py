@@ -0,0 +1,81 @@
+import functools
+import operator
+
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def inputs(sess, n):
+    return [sess.input("x{}".format(i)) for i in range(n)]
+
+
+def values(n):
+    return {"x{}".format(i): 3 * i + 2 for i in range(n)}
+
+
+def test_sum_is_one_expression():
+    sess = Session()
+    xs = inputs(sess, 5)
+    total = sess.sum(xs + [3])
+    code = sess.gen(total)
+    assert code.count(" <== ") == 1
+    assert "    sum_x0__ <== x0 + x1 + x2 + x3 + x4 + 3;" in code
+    witness = sess.compute_witness(total, values(5))
+    assert witness[total.fullname] == sum(values(5).values()) + 3
+    assert sess.sum([xs[0]]) is xs[0]
+    with pytest.raises(Exception, match="at least one operand"):
+        sess.sum([])
+
+
+def test_sum_matches_a_chain_of_additions():
+    chain = Session()
+    xs = inputs(chain, 6)
+    out = functools.reduce(operator.add, xs[1:], xs[0]) * xs[0]
+    sess = Session()
+    ys = inputs(sess, 6)
+    total = sess.sum(ys) * ys[0]
+    for n in (values(6), {"x{}".format(i): -i for i in range(6)}):
+        expected = chain.compute_witness(out, n)[out.fullname]
+        assert sess.compute_witness(total, n)[total.fullname] == expected
+
+
+def test_dot_folds_products_with_numbers():
+    sess = Session()
+    xs = inputs(sess, 5)
+    out = sess.dot(xs[:4], [3, -1, xs[4], 2])
+    code = sess.gen(out)
+    # only the product of two signals is a signal of its own
+    assert code.count(" <== ") == 2
+    assert " <== 3*x0 - x1 + x2_times_x4__ + 2*x3;" in code
+    n = values(5)
+    expected = (3 * n["x0"] - n["x1"] + n["x2"] * n["x4"] + 2 * n["x3"]) % P
+    assert sess.compute_witness(out, n)[out.fullname] == expected
+    with pytest.raises(Exception, match="dot product of 4 and 3 elements"):
+        sess.dot(xs[:4], [1, 2, 3])
+
+
+def test_dot_of_arrays():
+    sess = Session()
+    a = sess.input_array("a", 3)
+    b = sess.input_array("b", 3)
+    out = sess.dot(a, b)
+    assert "a_times_b__[i__] <== a[i__] * b[i__];" in sess.gen(out)
+    witness = sess.compute_witness(out, {"a": [1, 2, 3], "b": [4, 5, 6]})
+    assert witness[out.fullname] == 32
+    sess.check_witness(out, witness)
+
+
+def test_product_is_balanced():
+    sess = Session()
+    xs = inputs(sess, 8)
+    out = sess.product(xs)
+    assert out.fullname == "x0_times_x1_times_x2_times_x3_ti__"
+    code = sess.gen(out)
+    assert code.count(" <== ") == 7
+    assert " <== x0_times_x1__ * x2_times_x3__;" in code
+    assert " <== x4_times_x5__ * x6_times_x7__;" in code
+    n = values(8)
+    expected = functools.reduce(operator.mul, n.values()) % P
+    assert sess.compute_witness(out, n)[out.fullname] == expected
@@ -0,0 +1,92 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.field import P
+
+
+def circuit(templates):
+    sess = Session()
+    decorate = sess.template if templates else (lambda function: function)
+
+    @decorate
+    def square(x):
+        return x * x
+
+    @decorate
+    def step(x, y, k):
+        half = (x.detach() / 2).attach()
+        (half * 2).check_equals(x)
+        return [square(half) * k + y, square(y)]
+
+    a = sess.input("a")
+    b = sess.input("b", private=True)
+    first = step(a, b, 3)
+    second = step(b, a, 3)
+    third = step(a, b, 5)
+    return sess, first[0] + second[1] * third[0]
+
+
+def test_templates_are_generated_once():
+    sess, out = circuit(True)
+    code = sess.gen(out)
+    assert code.count("template square()") == 1
+    assert code.count("template step()") == 1
+    assert code.count("template step_v1()") == 1
+    # templates come before the templates that use them
+    assert code.index("template square()") < code.index("template step()")
+    assert code.count(" = step();") == 2
+    assert code.count(" = step_v1();") == 1
+    assert code.count(" = square();") == 4
+
+
+def test_templates_compute_the_same_witness():
+    inline, inline_out = circuit(False)
+    sess, out = circuit(True)
+    for a, b in [(4, 6), (10, 2), (0, 8)]:
+        inputs = {"a": a, "b": b}
+        expected = inline.compute_witness(inline_out, inputs)[inline_out.fullname]
+        witness = sess.compute_witness(out, inputs)
+        assert witness[out.fullname] == expected
+        assert sess.compile_evaluator(out)(inputs) == witness
+        sess.check_witness(out, witness)
+
+
+def test_template_constraints():
+    inline, inline_out = circuit(False)
+    sess, out = circuit(True)
+    inputs = {"a": 4, "b": 6}
+    cs, _, _, _ = sess._constraint_system(out, inputs)
+    for a, b, c in cs.constraints:
+        assert cs.value(a) * cs.value(b) % P == cs.value(c)
+    expected = inline.compute_witness(inline_out, inputs)[inline_out.fullname]
+    assert cs.values[1] == expected
+    assert "main.step_v1_0.square_2.x_times_x__" in cs.labels
+
+
+def test_template_check_failures():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b")
+
+    @sess.template
+    def same(x, y):
+        x.check_equals(y)
+        return x * y
+
+    out = same(a, b)
+    sess.check_witness(out, sess.compute_witness(out, {"a": 3, "b": 3}))
+    witness = sess.compute_witness(out, {"a": 3, "b": 4})
+    with pytest.raises(Exception, match="a constraint of same_0 fails"):
+        sess.check_witness(out, witness)
+
+
+def test_templates_cant_use_outside_signals():
+    sess = Session()
+    a = sess.input("a")
+
+    @sess.template
+    def leak(x):
+        return x * a
+
+    with pytest.raises(Exception, match="uses a, which was computed outside"):
+        leak(a)
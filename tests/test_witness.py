@@ -0,0 +1,216 @@
+import pytest
+
+from knowledgeflow import Session
+from knowledgeflow.dsl import VarInv
+from knowledgeflow.field import P, batch_inverse, inverse
+
+
+def divide(a, b):
+    q = (a.detach() / b.detach()).attach()
+    a.check_equals(q * b)
+    return q
+
+
+def circuit():
+    sess = Session()
+    a = sess.input("a")
+    b = sess.input("b", private=True)
+    q = divide(a, b)
+    out = q * q + a * 3 - b
+    return sess, out
+
+
+def test_compute_witness():
+    sess, out = circuit()
+    witness = sess.compute_witness(out, {"a": 12, "b": 4})
+    assert witness["a"] == 12
+    assert witness["b"] == 4
+    assert witness[out.fullname] == 9 + 36 - 4
+
+
+def test_compute_witness_in_the_field():
+    sess, out = circuit()
+    witness = sess.compute_witness(out, {"a": 1, "b": 2})
+    half = pow(2, -1, P)
+    assert witness[out.fullname] == (half * half + 3 - 2) % P
+    witness = sess.compute_witness(out, {"a": -4, "b": 2})
+    assert witness["a"] == P - 4
+    assert witness[out.fullname] == (4 - 12 - 2) % P
+
+
+def test_compute_witness_names_every_signal():
+    sess, out = circuit()
+    witness = sess.compute_witness(out, {"a": 12, "b": 4})
+    for line in sess.gen(out).splitlines():
+        line = line.strip()
+        if line.startswith("signal "):
+            assert line.rstrip(";").split()[-1] in witness
+
+
+def test_compute_witness_needs_every_input():
+    sess, out = circuit()
+    with pytest.raises(Exception, match="input b"):
+        sess.compute_witness(out, {"a": 12})
+
+
+def test_compute_witness_batch():
+    sess, out = circuit()
+    rows = [{"a": a, "b": b} for a in range(-3, 9) for b in (1, 2, 7, P - 1)]
+    batch = sess.compute_witness_batch(
+        out, {"a": [row["a"] for row in rows], "b": [row["b"] for row in rows]}
+    )
+    for i, row in enumerate(rows):
+        witness = sess.compute_witness(out, row)
+        assert {name: column[i] for name, column in batch.items()} == witness
+
+
+def test_compute_witness_batch_needs_columns_of_one_size():
+    sess, out = circuit()
+    with pytest.raises(Exception, match="same number"):
+        sess.compute_witness_batch(out, {"a": [1, 2], "b": [1]})
+
+
+def test_batch_inverse():
+    values = [1, 2, 3, P - 1, 12345678901234567890, P + 5]
+    assert batch_inverse(values) == [inverse(value) for value in values]
+    assert batch_inverse([]) == []
+    with pytest.raises(ZeroDivisionError):
+        batch_inverse([3, P, 4])
+
+
+def test_inverses_in_a_batch():
+    sess = Session()
+    a = sess.input("a")
+    inv = sess.make(VarInv, a.detach()).attach()
+    out = inv * a
+    values = [3, 0, P - 1, 0, 12345678901234567890, 1]
+    batch = sess.compute_witness_batch(out, {"a": values})
+    assert batch[inv.fullname] == [inverse(v) if v % P else 0 for v in values]
+    assert batch[out.fullname] == [1, 0, 1, 0, 1, 1]
+    assert sess.compute_witness_batch(out, {"a": [0, 0]})[inv.fullname] == [0, 0]
+
+
+def test_division_by_zero_in_a_batch():
+    sess, out = circuit()
+    with pytest.raises(ZeroDivisionError):
+        sess.compute_witness_batch(out, {"a": [1, 2, 3], "b": [1, 0, 2]})
+
+
+def extern_circuit():
+    sess = Session()
+    x = sess.input("x")
+    y = sess.input("y")
+    num2bits = sess.extern("Num2Bits", args=[8], inputs={"in": 1}, output=["out"])
+    less_than = sess.extern("LessThan", args=[8], inputs={"in": [2]}, output="out")
+    bits = num2bits(_in=x)
+    smaller = less_than(_in=[x, y])
+    parity = sess.cond(bits[0].detach(), x.detach() * 2, y.detach() - 1).attach()
+    out = sess.sum([bits[i] * bits[i + 1] for i in range(7)]) + smaller * parity
+    return sess, out
+
+
+def test_compiled_evaluator():
+    sess, out = circuit()
+    evaluate = sess.compile_evaluator(out)
+    for a, b in [(12, 4), (-1, 3), (5, P - 2)]:
+        inputs = {"a": a, "b": b}
+        assert evaluate(inputs) == sess.compute_witness(out, inputs)
+
+
+def test_compiled_evaluator_with_externs():
+    sess, out = extern_circuit()
+    evaluate = sess.compile_evaluator(out)
+    for x, y in [(0, 1), (5, 3), (77, 200), (255, 254)]:
+        inputs = {"x": x, "y": y}
+        assert evaluate(inputs) == sess.compute_witness(out, inputs)
+
+
+def test_compiled_evaluators_are_cached():
+    sess, out = circuit()
+    sess.compile_evaluator(out)
+    sess.compile_evaluator(out)
+    assert len(sess.evaluators) == 1
+
+
+def changing_circuit():
+    """Yields a circuit after each change that alters its signals without
+    adding any nodes: toggling fold_linear, and constraining existing nodes."""
+    sess = Session(fold_linear=False)
+    a = sess.input("a")
+    b = sess.input("b")
+    product = a * b
+    out = (a + b) * 2 + product
+    yield sess, out
+    sess.fold_linear = True
+    yield sess, out
+    product.check_equals(out)
+    yield sess, out
+    sess.fold_linear = False
+    yield sess, out
+
+
+def test_compiled_evaluators_follow_the_circuit():
+    for sess, out in changing_circuit():
+        inputs = {"a": 2, "b": 3}
+        assert sess.compile_evaluator(out)(inputs) == sess.compute_witness(out, inputs)
+
+
+def test_compute_witnesses_in_processes():
+    sess, out = extern_circuit()
+    inputs = [{"x": x, "y": (x * 7) % 256} for x in range(40)]
+    witnesses = list(sess.compute_witnesses(out, inputs, workers=2, chunk_size=3))
+    assert witnesses == [sess.compute_witness(out, row) for row in inputs]
+    assert list(sess.compute_witnesses(out, [], workers=2)) == []
+
+
+def test_compute_witnesses_follow_the_circuit():
+    inputs = [{"a": a, "b": a + 3} for a in range(5)]
+    for sess, out in changing_circuit():
+        witnesses = list(sess.compute_witnesses(out, inputs, workers=2))
+        assert witnesses == [sess.compute_witness(out, row) for row in inputs]
+
+
+def test_check_witness():
+    sess, out = extern_circuit()
+    for x, y in [(0, 1), (5, 3), (255, 254)]:
+        sess.check_witness(out, sess.compute_witness(out, {"x": x, "y": y}))
+
+
+def test_check_witness_finds_wrong_values():
+    sess, out = circuit()
+    witness = sess.compute_witness(out, {"a": 12, "b": 4})
+    witness[out.fullname] += 1
+    with pytest.raises(Exception, match="{} is".format(out.fullname)):
+        sess.check_witness(out, witness)
+
+
+def halving(sess):
+    a = sess.input("a")
+    half = (a.detach() / 2).attach()
+    (half * 2).check_equals(a)
+    return a * a, half
+
+
+def test_check_witness_finds_failing_checks():
+    sess = Session()
+    out, half = halving(sess)
+    witness = sess.compute_witness(out, {"a": 6})
+    witness[half.fullname] = 4
+    with pytest.raises(Exception, match="is checked to equal a, which is 6"):
+        sess.check_witness(out, witness)
+
+
+def test_check_witness_checks_externs():
+    sess, out = extern_circuit()
+    witness = sess.compute_witness(out, {"x": 300, "y": 1})
+    with pytest.raises(Exception, match="a constraint of Num2Bits_0 fails"):
+        sess.check_witness(out, witness)
+
+
+def test_check_witness_shows_origins():
+    sess = Session(track_origins=True)
+    out, half = halving(sess)
+    witness = sess.compute_witness(out, {"a": 6})
+    witness[half.fullname] = 4
+    with pytest.raises(Exception, match="test_witness.py"):
+        sess.check_witness(out, witness)